@@ -0,0 +1,99 @@
+"""
+Accuracy and speed of the plugin background estimate compared with the
+estimate of pyxudeconv it replaces (minimum of the adjoint of the forward
+model applied to the normalized measurements).
+
+Simulated measurements: Poisson noisy beads blurred by a Gaussian PSF on a
+constant background of a few photons. The true background is known.
+
+Note that pyxudeconv computes the adjoint anyway (initialization x0), so its
+estimate only costs one min(). The plugin estimate is cached per layer and
+ROI and can be shown before running.
+
+Usage: python benchmarks/background.py [size] [nviews]
+"""
+import sys
+import time
+
+import numpy as np
+import pyxudeconv.deconvolution.forward.convolution as forw
+from scipy.ndimage import gaussian_filter
+
+from napari_pyxu_deconv._background import estimate_background
+
+NZ = 32
+BACKGROUNDS = (2, 5, 20)  #photons
+BUFFERWIDTH = (15, 15, 15)  #default of the plugin
+
+
+def gaussian_psf(shape=(15, 15, 15), sigma=(2., 1.5, 1.5)):
+    psf = np.zeros(shape)
+    psf[tuple(s // 2 for s in shape)] = 1
+    return gaussian_filter(psf, sigma)
+
+
+def synthetic(size, nviews, background, seed=0):
+    """Poisson noisy beads blurred by a Gaussian PSF on a constant background"""
+    rng = np.random.default_rng(seed)
+    x = np.zeros((NZ, size, size))
+    coords = rng.integers(0, (NZ, size, size), size=(size // 2, 3)).T
+    x[tuple(coords)] = rng.uniform(500, 5000, coords.shape[1])
+    x = gaussian_filter(x, (2., 1.5, 1.5)) + background
+    # dimmer peripheral views (e.g., Airyscan)
+    weights = np.linspace(1, 0.5, nviews)
+    return rng.poisson(weights[:, None, None, None] * x).astype(
+        np.float32).squeeze(), weights
+
+
+def pyxudeconv_background(g, psf, nviews):
+    """Automatic background of pyxudeconv (deconvolve.py)
+
+    Returns:
+        tuple: background, time of the adjoint, time of the min
+    """
+
+    def read(arr, **kwargs):
+        return arr
+
+    forw_model, gn, trim_buffer, *_ = forw.getModel(psf, g, None, nviews, 0,
+                                                    None, 0, BUFFERWIDTH,
+                                                    None, '', np, read, read)
+    t0 = time.perf_counter()
+    x0 = forw_model.adjoint(gn)
+    t1 = time.perf_counter()
+    bg = max(float(trim_buffer(x0).min()) / (nviews if nviews > 1 else 1), 0.)
+    return bg, t1 - t0, time.perf_counter() - t1
+
+
+def timeit(fct, *args, repeat=3, **kwargs):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fct(*args, **kwargs)
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+def main(size=256, nviews=1):
+    psf = gaussian_psf()
+    if nviews > 1:
+        psf = np.stack([psf] * nviews)
+    print(f'{"bg (ph)":>7} | {"true":>9} | {"pyxudeconv":>10} | '
+          f'{"plugin":>9} | {"plugin full":>11} | {"adjoint (ms)":>12} | '
+          f'{"min (ms)":>8} | {"plugin (ms)":>11} | {"full (ms)":>9}')
+    for background in BACKGROUNDS:
+        g, weights = synthetic(size, nviews, background)
+        true = background * weights.mean() / float(g.max())
+        ref, t_adjoint, t_min = pyxudeconv_background(g, psf, nviews)
+        t_fast, fast = timeit(estimate_background, g, nviews > 1)
+        t_full, full = timeit(estimate_background,
+                              g,
+                              nviews > 1,
+                              nsamples=None)
+        print(f'{background:>7} | {true:9.2e} | {ref:10.2e} | {fast:9.2e} | '
+              f'{full:11.2e} | {1e3 * t_adjoint:12.1f} | {1e3 * t_min:8.2f} | '
+              f'{1e3 * t_fast:11.2f} | {1e3 * t_full:9.2f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
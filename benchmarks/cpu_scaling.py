@@ -0,0 +1,75 @@
+"""
+Scaling of a CPU deconvolution (RL) with the number of cores.
+
+Usage: python benchmarks/cpu_scaling.py [max_cores] [size]
+"""
+import os
+import sys
+import time
+from argparse import Namespace
+
+import numpy as np
+import pyxudeconv as pd
+from scipy.signal import fftconvolve
+
+from napari_pyxu_deconv._cpu_profile import cpu_profile
+
+
+def simulate(size=128, nz=32, seed=0):
+    rng = np.random.default_rng(seed)
+    obj = np.zeros((nz, size, size), dtype=np.float32)
+    idx = rng.integers(0, (nz, size, size), size=(size * 4, 3))
+    obj[tuple(idx.T)] = 1.
+    z, y, x = np.mgrid[-7:8, -15:16, -15:16]
+    psf = np.exp(-x**2 / 8 - y**2 / 8 - z**2 / 4).astype(np.float32)
+    psf /= psf.sum()
+    g = np.maximum(fftconvolve(obj, psf, mode='same'), 0) * 100
+    return rng.poisson(g).astype(np.float32) + 1, psf
+
+
+def get_param(data, psf, nepoch=20):
+    argv, sys.argv = sys.argv, sys.argv[:1]
+    param = vars(pd.get_param())
+    sys.argv = argv
+    param.update(
+        datapath=data,
+        psfpath=psf,
+        psf_sz=(-1, -1, psf.shape[-2], psf.shape[-1]),
+        roi=(0, 0, data.shape[-2], data.shape[-1]),
+        nviews=1,
+        coi=0,
+        gpu=-1,
+        bg=-1,
+        Nepoch=nepoch,
+        disp=0,
+        methods=['RL'],
+        config_RL={'acceleration': (True, )},
+        bufferwidth=(2, 4, 4),
+        fres='',
+        saveMeas=False,
+        saveIter=(1e8, ),
+        pxsz=(1., 1., 1.),
+        save_results=lambda *args: None,
+        create_fname=lambda *args: '',
+    )
+    return param
+
+
+def main(max_cores=None, size=128):
+    max_cores = max_cores or os.cpu_count()
+    data, psf = simulate(size)
+    timings = {}
+    for ncores in range(1, max_cores + 1):
+        param = get_param(data, psf)
+        with cpu_profile(threads=ncores, cores=f'0-{ncores - 1}'):
+            t0 = time.perf_counter()
+            pd.deconvolve(Namespace(**param))
+            timings[ncores] = time.perf_counter() - t0
+        print(f'{ncores:3d} core(s): {timings[ncores]:7.2f}s | '
+              f'speedup {timings[1] / timings[ncores]:5.2f} | '
+              f'efficiency {timings[1] / timings[ncores] / ncores:5.2f}')
+    return timings
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,61 @@
+"""
+Time and memory of the ROI/channel selection for the five dimension orders,
+compared with the former advanced-indexing implementation.
+
+Usage: python benchmarks/select_roi.py [size]
+"""
+import sys
+import time
+
+import numpy as np
+
+from napari_pyxu_deconv._widget import DIM_ORDERS, Deconvolution
+
+NVIEWS, NCHANNELS, NZ = 32, 2, 16
+
+
+def select_roi_copy(data, roi, coi, dim_order):
+    """Former implementation: advanced indexing (always copies)"""
+    dim_perm, dim_to_expand = DIM_ORDERS[dim_order]
+    data = data.transpose(dim_perm)
+    if dim_to_expand is not None:
+        data = data[dim_to_expand]
+    roi = Deconvolution.clip_roi(roi, data.shape)
+    coi = np.array(coi)
+    hoi = np.arange(data.shape[1])
+    return data[coi.reshape((-1, 1, 1, 1, 1)),
+                hoi.reshape((1, -1, 1, 1, 1)), :, roi[0]:roi[0] + roi[2],
+                roi[1]:roi[1] + roi[3], ].squeeze()
+
+
+def shape_of(dim_order, size):
+    sizes = {'N': NVIEWS, 'C': NCHANNELS, 'Z': NZ, 'Y': size, 'X': size}
+    return tuple(sizes[d] for d in dim_order)
+
+
+def timeit(fct, *args, repeat=5):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fct(*args)
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+def main(size=256):
+    roi = (-1, -1, size // 2, size // 2)
+    print(f'{"order":>6} | {"copy (ms)":>10} | {"view (ms)":>10} | '
+          f'{"copied (MB)":>11} | {"view shares memory":>18}')
+    for dim_order in DIM_ORDERS:
+        data = np.random.random(shape_of(dim_order, size)).astype(np.float32)
+        t_copy, out_copy = timeit(select_roi_copy, data, roi, 0, dim_order)
+        t_view, out_view = timeit(Deconvolution.select_roi, data, roi, 0,
+                                  dim_order)
+        assert np.array_equal(out_copy, out_view)
+        print(f'{dim_order:>6} | {1e3 * t_copy:10.3f} | {1e3 * t_view:10.3f} | '
+              f'{out_copy.nbytes / 1e6:11.1f} | '
+              f'{str(np.shares_memory(out_view, data)):>18}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,139 @@
+"""
+Fast estimation of the background (minimum value of the deconvolved volume).
+
+When the background is set to be automatically chosen, pyxudeconv takes the
+minimum of the adjoint of the forward model applied to the measurements,
+i.e., of a smoothed version of them. Here, neighbouring voxels are averaged
+in small blocks (which reduces the Poisson noise as the adjoint does) and a
+low percentile of the block means is computed on a strided (or random)
+subsample of the blocks. The result is on the same scale as the `bg`
+parameter, i.e., relative to the maximum of the measurements
+(`normalize_meas`).
+"""
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+#Maximal number of estimates kept per layer
+MAXSIZE = 32
+
+#Default number of voxels read for the estimation
+NSAMPLES = 2**18
+
+#Default number of neighbouring voxels (Z,Y,X) averaged in each block
+BINNING = (4, 4, 4)
+
+
+def block_means(g, binning=BINNING, nsamples=NSAMPLES, mode='strided', seed=0):
+    """Means of blocks of neighbouring voxels along the last three (Z,Y,X) dimensions of g
+
+    Args:
+        g (numpy.ndarray): measurements (...,Z,Y,X)
+        binning (3-tuple of int, optional): size of the blocks. Defaults to BINNING.
+        nsamples (int, optional): approximate number of voxels read per volume (None to use all the blocks). Defaults to NSAMPLES.
+        mode (str, optional): 'strided' or 'random' subsample of the blocks. Defaults to 'strided'.
+        seed (int, optional): seed of the random subsample. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: block means (...,Z',Y',X') or (...,M)
+    """
+    shape = np.array(g.shape[-3:])
+    binning = np.minimum(binning, shape)
+    nblocks = shape // binning
+    ntotal = int(np.prod(nblocks))
+    nkeep = ntotal if nsamples is None else min(
+        ntotal, max(1, nsamples // int(np.prod(binning))))
+    if mode == 'random' and nkeep < ntotal:
+        rng = np.random.default_rng(seed)
+        origins = np.unravel_index(rng.integers(0, ntotal, size=nkeep),
+                                   nblocks)
+        origins = [o * b for o, b in zip(origins, binning)]
+
+        def index(offset):
+            return (Ellipsis, *[o + d for o, d in zip(origins, offset)])
+    else:
+        stride = max(1, int(np.ceil((ntotal / nkeep)**(1 / 3))))
+        step = binning * stride
+        count = (shape - binning) // step + 1
+
+        def index(offset):
+            return (Ellipsis, *[
+                slice(d, d + (c - 1) * s + 1, s)
+                for d, c, s in zip(offset, count, step)
+            ])
+    out = 0.
+    for offset in np.ndindex(*binning):
+        #accumulated in float (no overflow for integer data)
+        out = out + np.asarray(g[index(offset)], dtype=float)
+    return out / np.prod(binning)
+
+
+def estimate_background(g,
+                        has_views=False,
+                        percentile=1.,
+                        binning=BINNING,
+                        nsamples=NSAMPLES,
+                        mode='strided',
+                        seed=0):
+    """Robust estimate of the background of the normalized measurements
+
+    Args:
+        g (numpy.ndarray): measurements (Z,Y,X) or (N,Z,Y,X) with views along the first axis
+        has_views (bool, optional): g has views along the first axis (averaged, as for the adjoint of the multi-view forward model). Defaults to False.
+        percentile (float, optional): percentile of the block means used as the background. Defaults to 1.
+        binning (3-tuple of int, optional): number of neighbouring voxels (Z,Y,X) averaged. Defaults to BINNING.
+        nsamples (int, optional): approximate number of voxels read (None for all the blocks). Defaults to NSAMPLES.
+        mode (str, optional): 'strided' or 'random' subsample. Defaults to 'strided'.
+        seed (int, optional): seed of the random subsample. Defaults to 0.
+
+    Returns:
+        float: background, relative to the maximum of the measurements
+    """
+    gmax = float(np.max(g))
+    if gmax <= 0:
+        return 0.
+    means = block_means(g, binning, nsamples, mode, seed)
+    if has_views:
+        means = means.mean(axis=0)
+    return max(float(np.percentile(means, percentile)) / gmax, 0.)
+
+
+class BackgroundCache:
+    """Background estimates per layer, keyed by ROI and selection
+
+    Layers are weakly referenced, such that the estimates of a deleted layer are dropped. The least
+    recently used estimates of a layer are evicted beyond maxsize entries.
+
+    Args:
+        maxsize (int, optional): maximal number of estimates kept per layer. Defaults to MAXSIZE.
+    """
+
+    def __init__(self, maxsize=MAXSIZE):
+        self.maxsize = maxsize
+        self._values = weakref.WeakKeyDictionary()
+
+    def get(self, layer, key, estimate):
+        """Return the estimate of layer stored at key, computed with estimate() if missing"""
+        values = self._values.setdefault(layer, OrderedDict())
+        if key in values:
+            values.move_to_end(key)
+        else:
+            values[key] = estimate()
+            while len(values) > self.maxsize:
+                values.popitem(last=False)
+        return values[key]
+
+    def peek(self, layer, key):
+        """Cached estimate (None if not estimated yet)"""
+        return self._values.get(layer, {}).get(key)
+
+    def discard(self, layer):
+        """Drop the estimates of layer (e.g., its data was replaced)"""
+        self._values.pop(layer, None)
+
+    def __len__(self):
+        return sum(len(values) for values in self._values.values())
+
+    def clear(self):
+        self._values.clear()
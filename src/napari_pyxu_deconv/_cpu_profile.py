@@ -0,0 +1,124 @@
+"""
+CPU execution profile: number of threads used by torch and BLAS, number of
+FFT workers and core affinity, applied for the duration of a run.
+"""
+import contextlib
+import os
+
+import scipy.fft
+import torch
+from threadpoolctl import threadpool_limits
+
+
+def available_cores():
+    """Cores the process is allowed to run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return os.sched_getaffinity(0)
+    return set(range(os.cpu_count()))
+
+
+def parse_cores(cores):
+    """Parse a list of cores such as "0-3,8,10-11"
+
+    Args:
+        cores (str): comma-separated cores or ranges of cores. Empty for no affinity.
+
+    Raises:
+        ValueError: malformed list or cores not available to the process
+
+    Returns:
+        set of int: cores
+    """
+    out = set()
+    for item in str(cores).replace(' ', '').split(','):
+        if item == '':
+            continue
+        try:
+            if '-' in item:
+                first, last = map(int, item.split('-'))
+                if last < first:
+                    raise ValueError
+                out.update(range(first, last + 1))
+            else:
+                out.add(int(item))
+        except ValueError:
+            raise ValueError(
+                f'Invalid cores "{cores}". Expected e.g. "0-3,8".') from None
+    unavailable = out - available_cores()
+    if len(unavailable) > 0:
+        raise ValueError(
+            f'Cores {sorted(unavailable)} are not available (available: {sorted(available_cores())}).'
+        )
+    return out
+
+
+def _thread_ids():
+    """Native ids of the threads of the process (Linux), the calling thread otherwise"""
+    try:
+        return [int(tid) for tid in os.listdir('/proc/self/task')]
+    except OSError:
+        return [0]
+
+
+def _set_affinity(tid, cores):
+    #the thread may have exited meanwhile
+    with contextlib.suppress(ProcessLookupError):
+        os.sched_setaffinity(tid, cores)
+
+
+def set_affinity(cores):
+    """Set the core affinity of every thread of the process
+
+    os.sched_setaffinity only applies to the calling thread on Linux: threads
+    already running (e.g., OpenMP or BLAS pools) would keep their mask.
+
+    Args:
+        cores (set of int): cores
+
+    Returns:
+        callable: restores the previous masks. Threads started meanwhile get the
+            previous mask of the calling thread.
+    """
+    default = os.sched_getaffinity(0)
+    old = {}
+    for tid in _thread_ids():
+        try:
+            old[tid] = os.sched_getaffinity(tid)
+        except ProcessLookupError:
+            continue
+        _set_affinity(tid, cores)
+
+    def restore():
+        for tid in _thread_ids():
+            _set_affinity(tid, old.get(tid, default))
+
+    return restore
+
+
+@contextlib.contextmanager
+def cpu_profile(threads=0, fft_workers=0, cores=''):
+    """Context manager limiting the CPU resources of a run
+
+    Previous settings are restored on exit.
+
+    Args:
+        threads (int, optional): intra-op threads for torch and BLAS (0 to keep the default). Defaults to 0.
+        fft_workers (int, optional): workers of scipy.fft (0 to keep the default). Defaults to 0.
+        cores (str, optional): core affinity, e.g. "0-7" (empty to keep the default). Defaults to ''.
+    """
+    cores = parse_cores(cores)
+    if threads <= 0 and len(cores) > 0:
+        threads = len(cores)
+    if fft_workers <= 0:
+        fft_workers = threads
+    with contextlib.ExitStack() as stack:
+        if len(cores) > 0 and hasattr(os, 'sched_setaffinity'):
+            stack.callback(set_affinity(cores))
+        if threads > 0:
+            old_threads = torch.get_num_threads()
+            torch.set_num_threads(threads)
+            stack.callback(torch.set_num_threads, old_threads)
+            stack.enter_context(threadpool_limits(limits=threads))
+        if fft_workers > 0:
+            stack.enter_context(scipy.fft.set_workers(fft_workers))
+        yield
@@ -0,0 +1,198 @@
+"""
+Low-overhead convergence metrics computed during the iterations of the
+pyxudeconv solvers.
+
+Every `interval` iterations, scalar diagnostics are computed on the device
+with reductions (only scalars are transferred):
+
+- residual: relative data-fit residual ||H x + bg - g|| / ||g||, or
+  ||H x - g|| / ||g|| for the methods where bg is a lower bound of x
+  (Tikhonov, GLS) instead of an additive term of the data model
+- update: relative update norm ||x_k - x_{k-1}|| / ||x_k||
+- objective: objective value, when tracked by the solver
+"""
+import contextlib
+import threading
+import time
+
+import pyxu.abc as pxa
+import pyxu.util as pxu
+from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
+from matplotlib.figure import Figure
+from pyxudeconv.deconvolution.methods.ABC import HyperParametersOptimizer
+from qtpy.QtWidgets import QApplication, QVBoxLayout, QWidget
+
+METRICS = ("residual", "update", "objective")
+
+#Methods whose data model is H x + bg (bg is a lower bound of x for the others)
+BG_IN_DATA = ("RL", "RLTV", "GARL", "GKL")
+
+
+class IterationMetrics:
+    """Collect scalar diagnostics while pyxudeconv runs
+
+    Use as a context manager around `pd.deconvolve`.
+
+    Args:
+        interval (int): metrics are computed every interval iterations
+        callback (callable, optional): called with the history after each new sample. Defaults to None.
+    """
+
+    def __init__(self, interval, callback=None):
+        self.interval = int(interval)
+        self.callback = callback
+        self.history = []
+        self.timings = {}  #duration of each method
+        self._local = threading.local()  #methods may run in several threads
+        self._lock = threading.Lock()
+        self._nrun = 0
+
+    @contextlib.contextmanager
+    def _patch(self, cls, name, wrapper):
+        original = getattr(cls, name)
+        setattr(cls, name, wrapper(original))
+        try:
+            yield
+        finally:
+            setattr(cls, name, original)
+
+    def __enter__(self):
+        self._stack = contextlib.ExitStack()
+        if self.interval > 0:
+            self._stack.enter_context(
+                self._patch(HyperParametersOptimizer, 'optimize_hyperparams',
+                            self._wrap_optimize))
+            self._stack.enter_context(
+                self._patch(pxa.Solver, 'steps', self._wrap_steps))
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.close()
+        return False
+
+    def _wrap_optimize(self, optimize_hyperparams):
+        metrics = self
+
+        def wrapper(optimizer, *args, **kwargs):
+            method = type(optimizer).__name__
+            metrics._local.problem = (
+                method,
+                getattr(optimizer, '_forw', None),
+                getattr(optimizer, '_g', None),
+                getattr(optimizer, '_bg_est', 0),
+            )
+            t0 = time.perf_counter()
+            out = optimize_hyperparams(optimizer, *args, **kwargs)
+            metrics.timings[method] = time.perf_counter() - t0
+            return out
+
+        return wrapper
+
+    def _wrap_steps(self, steps):
+        metrics = self
+
+        def wrapper(solver, n=None):
+            with metrics._lock:
+                metrics._nrun += 1
+                metrics._local.run = metrics._nrun
+            x_prev = None
+            citer = 0
+            for citer, data in enumerate(steps(solver, n), 1):
+                mst = solver._mstate
+                if citer % metrics.interval == 0:
+                    metrics.sample(solver, citer, x_prev)
+                x_prev = None
+                if (citer + 1) % metrics.interval == 0 and 'x_prev' not in mst:
+                    # device-side copy, only at the iteration before a sample
+                    x_prev = mst['x'].copy()
+                yield data
+            if citer % metrics.interval != 0:
+                # last iterate is always sampled
+                metrics.sample(solver, citer)
+
+        return wrapper
+
+    def sample(self, solver, citer, x_prev=None):
+        """Compute the metrics of the current iterate of solver"""
+        mst = solver._mstate
+        x = mst['x']
+        xp = pxu.get_array_module(x)
+        problem = getattr(self._local, 'problem', None)
+        out = {'run': getattr(self._local, 'run', 0), 'iteration': citer}
+        if problem is not None:
+            out['method'] = problem[0]
+        if x_prev is None:
+            x_prev = mst.get('x_prev', None)
+        if x_prev is not None and x_prev is not x:
+            out['update'] = float(
+                xp.linalg.norm(x - x_prev) /
+                max(float(xp.linalg.norm(x)), 1e-12))
+        if problem is not None and problem[1] is not None:
+            method, forw, g, bg = problem
+            res = forw.apply(x)
+            if method in BG_IN_DATA:
+                res += bg
+            res -= g
+            out['residual'] = float(
+                xp.linalg.norm(res) / max(float(xp.linalg.norm(g)), 1e-12))
+            del res
+        stop_info = solver._astate['stop_crit'].info()
+        if 'Memorize[objective_func]' in stop_info:
+            out['objective'] = stop_info['Memorize[objective_func]']
+        with self._lock:
+            self.history.append(out)
+        if self.callback is not None:
+            self.callback(self.history)
+        return out
+
+
+class MetricsPlot(QWidget):
+    """Dockable plot of the convergence metrics"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.figure = Figure(figsize=(4, 4), tight_layout=True)
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        self.axes = self.figure.subplots(len(METRICS), 1, sharex=True)
+        layout = QVBoxLayout()
+        layout.addWidget(self.canvas)
+        self.setLayout(layout)
+        self.reset()
+
+    def reset(self):
+        """Clear the plot"""
+        self._history = None
+        self._nsamples = 0  #samples of the history already plotted
+        self._lines = {}  #(metric, run) -> (line, iterations, values)
+        for ax, name in zip(self.axes, METRICS):
+            ax.clear()
+            ax.set_ylabel(name)
+            if name != 'objective':
+                ax.set_yscale('log')
+        self.axes[-1].set_xlabel('iteration')
+        self.canvas.draw_idle()
+
+    def update_plot(self, history):
+        """Append the new samples of the history of :class:`IterationMetrics` to the plot"""
+        if history is not self._history:
+            self.reset()
+            self._history = history
+        for sample in history[self._nsamples:]:
+            for ax, name in zip(self.axes, METRICS):
+                if name not in sample:
+                    continue
+                key = (name, sample['run'])
+                if key not in self._lines:
+                    line, = ax.plot([], [], label=f'{sample["run"]}')
+                    self._lines[key] = (line, [], [])
+                line, iterations, values = self._lines[key]
+                iterations.append(sample['iteration'])
+                values.append(sample[name])
+                line.set_data(iterations, values)
+        self._nsamples = len(history)
+        for ax in self.axes:
+            ax.relim()
+            ax.autoscale_view()
+        self.canvas.draw()
+        # the deconvolution runs in the GUI thread (the widget is disabled)
+        QApplication.processEvents()
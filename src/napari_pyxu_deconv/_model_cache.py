@@ -0,0 +1,266 @@
+"""
+Process-wide cache of the trained models used by the learned methods
+(GARL, GLS and GKL).
+
+pyxudeconv reloads the checkpoint, rebuilds the network and recomputes its
+spectral norm every time a solver is initialized. The cache keeps the
+models in memory, keyed by (model path, epoch, device, dtype), and evicts
+the least recently used ones when the memory budget is exceeded.
+"""
+import importlib
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+
+LEARNED_METHODS = ("GARL", "GLS", "GKL")
+
+#Default memory budget of the cache (in bytes)
+DEFAULT_BUDGET = 2 * 1024**3
+
+
+def model_nbytes(model):
+    """Memory footprint of the parameters and buffers of a torch module
+
+    Args:
+        model (torch.nn.Module): model
+
+    Returns:
+        int: number of bytes
+    """
+    tensors = list(model.parameters()) + list(model.buffers())
+    return int(sum(t.numel() * t.element_size() for t in tensors))
+
+
+def resolve_model_path(name, airyscan=True):
+    """Return the folder of the trained model
+
+    An empty name (or 'default model') selects the model shipped with
+    pyxudeconv, as done by the learned methods.
+
+    Args:
+        name (str): folder of the trained model
+        airyscan (bool, optional): multi-view data. Defaults to True.
+
+    Returns:
+        str: folder of the trained model
+    """
+    if name is not None and str(name) not in ('', 'default model'):
+        return str(name)
+    modality = 'airyscan_params' if airyscan else 'widefield_params'
+    module_config = importlib.import_module(
+        'pyxudeconv.deconvolution.methods.configs.GARL.' + modality)
+    return getattr(module_config, modality)()['model'][0]
+
+
+class ModelCache:
+    """LRU cache of trained models with a memory budget
+
+    Args:
+        budget (int, optional): maximal number of bytes kept in the cache.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(name, epoch, device, dtype=torch.float32):
+        return (
+            os.path.abspath(str(name)),
+            None if epoch is None else int(epoch),
+            str(torch.device(device)),
+            str(dtype),
+        )
+
+    def __contains__(self, key):
+        return key in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+    @property
+    def nbytes(self):
+        return sum(self._sizes.values())
+
+    def get(self, key, loader):
+        """Return the model stored at key, loaded with loader() if missing
+
+        Args:
+            key (tuple): key built with :func:`ModelCache.make_key`
+            loader (callable): function without argument returning the model
+
+        Returns:
+            torch.nn.Module: model
+        """
+        with self._lock:
+            if key in self._models:
+                self.hits += 1
+                self._models.move_to_end(key)
+                return self._models[key]
+            self.misses += 1
+            model = loader()
+            self._models[key] = model
+            self._sizes[key] = model_nbytes(model)
+            self._evict(keep=key)
+            return model
+
+    def _evict(self, keep=None):
+        while self.nbytes > self.budget and len(self._models) > 1:
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                break
+            self.pop(oldest)
+
+    def pop(self, key):
+        with self._lock:
+            self._sizes.pop(key, None)
+            return self._models.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._sizes.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+MODEL_CACHE = ModelCache()
+
+#Loaders of pyxudeconv replaced by :func:`install`
+_ORIGINAL_LOADERS = {}
+
+
+def _memoize_spectral_norm(conv_layer):
+    """The learned methods recompute the spectral norm of the (fixed) weights
+    with 200 power iterations at every initialization. Keep the first
+    estimate for a given (mode, n_steps)."""
+    spectral_norm = conv_layer.spectral_norm
+    memo = {}
+
+    def cached_spectral_norm(mode="Fourier", n_steps=1000):
+        if (mode, n_steps) not in memo:
+            memo[(mode, n_steps)] = spectral_norm(mode=mode, n_steps=n_steps)
+        conv_layer.L = memo[(mode, n_steps)]
+        return conv_layer.L
+
+    conv_layer.spectral_norm = cached_spectral_norm
+
+
+def _load_model(name, device, epoch, do3D, doSplineActivation, dtype):
+    load = _ORIGINAL_LOADERS.get('GARL')
+    if load is None:
+        load = importlib.import_module(
+            'pyxudeconv.deconvolution.methods.GARL').load_model_weakly_convex
+    model, *_ = load(
+        name,
+        device=device,
+        epoch=epoch,
+        do3D=do3D,
+        doSplineActivation=doSplineActivation,
+    )
+    model.to(device=device, dtype=dtype)
+    _memoize_spectral_norm(model.conv_layer)
+    return model
+
+
+def load_model_weakly_convex(
+    name,
+    sigma=None,
+    device='cuda:0',
+    epoch=None,
+    do3D=False,
+    doSplineActivation=True,
+    dtype=torch.float32,
+):
+    """Drop-in replacement of pyxudeconv's `load_model_weakly_convex` that
+    goes through :data:`MODEL_CACHE`.
+
+    Only the model is cached: the functions evaluating the regularizer are
+    rebuilt for the given sigma.
+    """
+    key = ModelCache.make_key(name, epoch, device, dtype)
+    key = key + (do3D, doSplineActivation)
+    model = MODEL_CACHE.get(
+        key,
+        lambda: _load_model(name, device, epoch, do3D, doSplineActivation,
+                            dtype),
+    )
+
+    def arrange(arr):
+        arr = arr.to(dtype)
+        if do3D:
+            if arr.ndim == 2:
+                arr = arr.unsqueeze(0).unsqueeze(0).unsqueeze(0)
+            elif arr.ndim == 3:
+                arr = arr.unsqueeze(0)
+            elif arr.ndim == 4 and arr.shape[-4] > 1:
+                #concatenate all channels in samples dim
+                arr = arr.reshape(-1, 1, *arr.shape[-3:])
+        else:
+            if arr.ndim == 2:
+                arr = arr.unsqueeze(0).unsqueeze(0)
+            elif arr.ndim == 3:
+                if arr.shape[-3] > 1:  #expects one channel only
+                    arr = arr.unsqueeze(1)
+                else:
+                    arr = arr.unsqueeze(0)
+            elif arr.ndim == 4 and arr.shape[-3] > 1:
+                #concatenate all in samples dim
+                arr = arr.reshape(-1, 1, *arr.shape[2:])
+        return arr
+
+    def applyNN(arr):
+        with torch.no_grad():
+            return model.cost(arrange(arr), sigma=sigma).sum()
+
+    def gradNN(arr):
+        with torch.no_grad():
+            shape_og = arr.shape
+            return model.grad(arrange(arr), sigma=sigma).reshape(shape_og)
+
+    def proxNN(arr, rho):
+        with torch.no_grad():
+            return model.forward(arrange(arr))
+
+    return model, applyNN, gradNN, proxNN
+
+
+def install():
+    """Route the model loading of the learned methods through the cache.
+    Can be called several times."""
+    for method in LEARNED_METHODS:
+        module = importlib.import_module(
+            f'pyxudeconv.deconvolution.methods.{method}')
+        if method not in _ORIGINAL_LOADERS:
+            _ORIGINAL_LOADERS[method] = module.load_model_weakly_convex
+        module.load_model_weakly_convex = load_model_weakly_convex
+
+
+def preload(name, epoch, device, airyscan=True, dtype=torch.float32):
+    """Load a trained model in the cache before running
+
+    Args:
+        name (str): folder of the trained model ('' for the default model)
+        epoch (int): epoch of interest
+        device (str): torch device (e.g., 'cpu' or 'cuda:0')
+        airyscan (bool, optional): multi-view data. Defaults to True.
+
+    Returns:
+        torch.nn.Module: model
+    """
+    name = resolve_model_path(name, airyscan=airyscan)
+    model, *_ = load_model_weakly_convex(
+        name,
+        device=device,
+        epoch=epoch,
+        do3D=True,
+        doSplineActivation=False,
+        dtype=dtype,
+    )
+    return model
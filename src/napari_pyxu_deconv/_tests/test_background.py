@@ -0,0 +1,113 @@
+import gc
+
+import numpy as np
+import pytest
+
+from napari_pyxu_deconv._background import (
+    BackgroundCache,
+    block_means,
+    estimate_background,
+)
+from napari_pyxu_deconv._widget import Deconvolution
+
+
+def test_block_means():
+    g = np.random.random((2, 8, 16, 16))
+    expected = g.reshape(2, 4, 2, 8, 2, 8, 2).mean(axis=(2, 4, 6))
+    np.testing.assert_allclose(block_means(g, (2, 2, 2), None), expected)
+    sub = block_means(g, (2, 2, 2), 2**7)
+    assert sub.shape[0] == 2 and sub[0].size < expected[0].size
+    np.testing.assert_allclose(sub, expected[:, ::3, ::3, ::3])
+    sub = block_means(g, (2, 2, 2), 2**7, mode='random')
+    assert sub.shape == (2, 2**4)
+    # every sample is the mean of a block of its view
+    dist = np.abs(sub[..., None] - expected.reshape(2, 1, -1)).min(axis=-1)
+    assert np.all(dist < 1e-12)
+    # integer data is averaged without overflow
+    g = np.full((4, 4, 4), 2**16 - 1, dtype=np.uint16)
+    assert block_means(g, (4, 4, 4)).item() == 2**16 - 1
+
+
+@pytest.mark.parametrize("background", [2, 5, 20])
+@pytest.mark.parametrize("mode", ['strided', 'random'])
+def test_estimate_background(background, mode):
+    rng = np.random.default_rng(1)
+    x = np.full((32, 128, 128), float(background))
+    x[12:20, 48:80, 48:80] += 200
+    g = rng.poisson(x).astype(np.float32)
+    true = background / g.max()
+    full = estimate_background(g, nsamples=None)
+    fast = estimate_background(g, nsamples=2**16, mode=mode)
+    assert fast == pytest.approx(full, rel=0.1)
+    # the block means are not biased low by the Poisson noise
+    assert 0.7 * true < fast <= true
+    assert estimate_background(np.zeros((4, 8, 8))) == 0.
+
+
+def test_estimate_background_views():
+    g = np.stack([np.full((8, 16, 16), 2.), np.full((8, 16, 16), 4.)])
+    g[1, 0, 0, 0] = 8.
+    assert estimate_background(g, has_views=True) == pytest.approx(3. / 8)
+
+
+def test_background_cache():
+
+    class Layer:
+        data = np.zeros((4, 8, 8))
+
+    cache = BackgroundCache(maxsize=2)
+    layer = Layer()
+    calls = []
+    key = ((0, 0, 8, 8), 0)
+    assert cache.peek(layer, key) is None
+    assert cache.get(layer, key, lambda: calls.append(1) or 0.5) == 0.5
+    assert cache.get(layer, key, lambda: calls.append(1) or 0.7) == 0.5
+    assert cache.peek(layer, key) == 0.5
+    assert len(calls) == 1
+    # another layer does not share the estimates
+    assert cache.peek(Layer(), key) is None
+    # the least recently used estimate is evicted
+    cache.get(layer, ((0, 0, 4, 4), 0), lambda: 0.1)
+    cache.get(layer, key, lambda: 0.7)
+    cache.get(layer, ((0, 0, 2, 2), 0), lambda: 0.2)
+    assert len(cache) == 2
+    assert cache.peek(layer, ((0, 0, 4, 4), 0)) is None
+    assert cache.peek(layer, key) == 0.5
+    cache.discard(layer)
+    assert cache.peek(layer, key) is None
+    # the estimates of a deleted layer are dropped
+    cache.get(layer, key, lambda: 0.5)
+    del layer
+    gc.collect()
+    assert len(cache) == 0
+
+
+def test_bg_estimate_on_demand(make_napari_viewer):
+    viewer = make_napari_viewer()
+    layer = viewer.add_image(
+        np.random.default_rng(0).poisson(5., (8, 32, 32)).astype(float))
+    widget = Deconvolution(viewer)
+    viewer.window.add_dock_widget(widget)
+    widget._airyscan_layer.value = False
+    widget._image_layer_meas.value = layer
+    widget._bg_layer.value = -1
+    widget._roiw_layer.value = 16
+    widget._roih_layer.value = 16
+    # nothing is computed when the widgets change
+    assert len(widget._bg_cache) == 0
+    assert 'Estimate' not in widget._bg_layer.label
+    widget.estimate_bg()
+    assert len(widget._bg_cache) == 1
+    assert 'Estimate' in widget._bg_layer.label
+    widget._roiw_layer.value = 8
+    assert 'Estimate' not in widget._bg_layer.label
+    # replacing the data or deleting the layer drops the estimates
+    widget._roiw_layer.value = 16
+    widget.estimate_bg()
+    assert len(widget._bg_cache) == 1
+    layer.data = np.ones((8, 32, 32))
+    assert len(widget._bg_cache) == 0
+    assert 'Estimate' not in widget._bg_layer.label
+    widget.estimate_bg()
+    viewer.layers.remove(layer)
+    assert len(widget._bg_cache) == 0
@@ -0,0 +1,29 @@
+import napari_pyxu_deconv._widget as _widget
+from napari_pyxu_deconv._widget import Deconvolution, method_devices
+
+
+def test_method_devices_single_device(monkeypatch):
+    monkeypatch.setattr(_widget, 'NGPU', 1)
+    param = {'gpu': 0, 'methods': ['RL', 'RLTV', 'GARL']}
+    assert method_devices(param) == {0: ['RL', 'RLTV', 'GARL']}
+    param['gpu'] = -1
+    assert method_devices(param) == {-1: ['RL', 'RLTV', 'GARL']}
+
+
+def test_method_devices_several_gpus(monkeypatch):
+    monkeypatch.setattr(_widget, 'NGPU', 2)
+    param = {'gpu': 1, 'methods': ['RL', 'RLTV', 'GARL']}
+    assert method_devices(param) == {1: ['RL', 'GARL'], 0: ['RLTV']}
+
+
+def test_comparison_table_reused(make_napari_viewer):
+    widget = Deconvolution(make_napari_viewer())
+    summary = [{'method': 'RL', 'time (s)': 1., 'residual': .1}]
+    widget.update_comparison_table('meas_roi_0', summary)
+    table = widget._comparison_table
+    widget.update_comparison_table('meas_roi_1', summary)
+    assert widget._comparison_table is table
+    assert list(
+        table.value['columns']) == ['ROI', 'RL time (s)', 'RL residual']
+    assert [row[0] for row in table.value['data']
+            ] == ['meas_roi_0', 'meas_roi_1']
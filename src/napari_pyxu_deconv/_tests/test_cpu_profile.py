@@ -0,0 +1,62 @@
+import os
+import threading
+
+import pytest
+import scipy.fft
+import torch
+
+from napari_pyxu_deconv import _cpu_profile
+from napari_pyxu_deconv._cpu_profile import cpu_profile, parse_cores
+
+
+def test_parse_cores(monkeypatch):
+    monkeypatch.setattr(_cpu_profile, 'available_cores',
+                        lambda: set(range(16)))
+    assert parse_cores('') == set()
+    assert parse_cores('0') == {0}
+    assert parse_cores('0-3, 8') == {0, 1, 2, 3, 8}
+    for cores in ('a-b', '3-1', '0,,x', '8-20'):
+        with pytest.raises(ValueError):
+            parse_cores(cores)
+
+
+def test_cpu_profile_restores():
+    threads = torch.get_num_threads()
+    workers = scipy.fft.get_workers()
+    with cpu_profile(threads=1, fft_workers=2):
+        assert torch.get_num_threads() == 1
+        assert scipy.fft.get_workers() == 2
+    assert torch.get_num_threads() == threads
+    assert scipy.fft.get_workers() == workers
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_setaffinity')
+                    or len(os.sched_getaffinity(0)) < 2,
+                    reason='requires core affinity and two cores')
+def test_cpu_profile_affinity_all_threads():
+    cores = os.sched_getaffinity(0)
+    first = min(cores)
+    started, stop = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        stop.wait()
+
+    before = threading.Thread(target=work)
+    before.start()
+    started.wait()
+    started.clear()
+    with cpu_profile(cores=str(first)):
+        #threads already running are pinned too
+        assert os.sched_getaffinity(before.native_id) == {first}
+        during = threading.Thread(target=work)
+        during.start()
+        started.wait()
+        assert os.sched_getaffinity(during.native_id) == {first}
+    assert os.sched_getaffinity(0) == cores
+    assert os.sched_getaffinity(before.native_id) == cores
+    #threads started inside the context are unpinned after exit
+    assert os.sched_getaffinity(during.native_id) == cores
+    stop.set()
+    before.join()
+    during.join()
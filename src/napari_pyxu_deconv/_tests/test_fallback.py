@@ -0,0 +1,64 @@
+import numpy as np
+
+import napari_pyxu_deconv._widget as _widget
+from napari_pyxu_deconv._widget import Deconvolution, is_oom
+
+
+def test_is_oom():
+    assert is_oom(MemoryError())
+    assert is_oom(RuntimeError('CUDA out of memory. Tried to allocate 2 GiB'))
+    assert not is_oom(RuntimeError('shape mismatch'))
+
+
+def test_tile_roi():
+    tiles = Deconvolution.tile_roi((10, 20, 5, 8), (3, 5, 8))
+    assert tiles == [(10, 20, 2, 4), (10, 24, 2, 4), (12, 20, 3, 4),
+                     (12, 24, 3, 4)]
+
+
+def test_oom_retry(make_napari_viewer, monkeypatch):
+    viewer = make_napari_viewer()
+    viewer.add_image(np.zeros((4, 8, 8)), name='meas')
+    widget = Deconvolution(viewer)
+    viewer.window.add_dock_widget(widget)
+    widget._image_layer_meas.value = viewer.layers['meas']
+    monkeypatch.setattr(_widget, 'free_memory', lambda: None)
+    calls = []
+    bgs = {}
+
+    def deconvolve(param, roi, fid, metadata):
+        calls.append((fid, param['gpu']))
+        bgs[fid] = (param['bg'], metadata['bg'])
+        widget.save_results(param['datapath'], fid, (1, 1, 1), 'pixel')
+        # on GPU, the full problem and the second tile do not fit
+        if param['gpu'] >= 0 and not fid.endswith(('_tile_0', '_tile_2')):
+            raise MemoryError()
+
+    monkeypatch.setattr(widget, '_deconvolve', deconvolve)
+    # tiles of different brightness, automatic background of 1 photon
+    data = np.ones((4, 8, 8))
+    data[0, :4, :4] = 10
+    data[0, :4, 4:] = 5
+    data[0, 4:, :4] = 2
+    param = {
+        'gpu': 0,
+        'oomretry': True,
+        'bg': 0.1,
+        'datapath': data,
+        'psfpath': np.zeros((4, 8, 8)),
+    }
+    metadata = {'bg': 0.1}
+    widget.deconvolve(param, (0, 0, 8, 8), 'meas', metadata)
+
+    tiles = [f'meas_tile_{tile}' for tile in range(4)]
+    assert calls == [('meas', 0), (tiles[0], 0), (tiles[1], 0)] + [
+        (tile, -1) for tile in tiles
+    ]
+    assert metadata['fallbacks'] == ['tiled', 'cpu']
+    # the layers of the failed attempts (including tile 0) are removed
+    assert [layer.name for layer in viewer.layers] == ['meas'] + tiles
+    # the automatic background is rescaled to the maximum of each tile
+    assert bgs['meas'] == (0.1, 0.1)
+    for tile, tile_max in zip(tiles, (10, 5, 2, 1)):
+        assert np.allclose(bgs[tile], 1 / tile_max)
+    assert metadata['bg'] == 0.1
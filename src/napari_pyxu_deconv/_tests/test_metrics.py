@@ -0,0 +1,58 @@
+import numpy as np
+import pyxu.abc as pxa
+import pyxu.opt.stop as pxst
+from pyxu.abc.solver import SolverMode
+from pyxu.operator import HomothetyOp, SquaredL2Norm
+from pyxu.opt.solver import PGD
+
+from napari_pyxu_deconv._metrics import IterationMetrics, MetricsPlot
+
+
+def test_iteration_metrics():
+    steps = pxa.Solver.steps
+    f = SquaredL2Norm(dim_shape=(8, )).argshift(-np.ones(8))
+    solver = PGD(f, show_progress=False)
+    with IterationMetrics(2) as metrics:
+        solver.fit(
+            mode=SolverMode.MANUAL,
+            x0=np.zeros(8),
+            stop_crit=pxst.MaxIter(6),
+            track_objective=True,
+        )
+        for _ in solver.steps():
+            pass
+    assert pxa.Solver.steps is steps
+    assert [h['iteration'] for h in metrics.history] == [2, 4, 6]
+    assert all('update' in h and 'objective' in h for h in metrics.history)
+
+
+def test_metrics_plot_appends(qtbot):
+    plot = MetricsPlot()
+    qtbot.addWidget(plot)
+    history = [{'run': 1, 'iteration': 2, 'residual': 0.5}]
+    plot.update_plot(history)
+    line = plot.axes[0].lines[0]
+    history.append({'run': 1, 'iteration': 4, 'residual': 0.25, 'update': .1})
+    plot.update_plot(history)
+    # existing artists are extended, not redrawn from scratch
+    assert plot.axes[0].lines[0] is line
+    assert list(line.get_xdata()) == [2, 4]
+    assert len(plot.axes[1].lines) == 1
+    plot.update_plot([{'run': 1, 'iteration': 1, 'residual': 1.}])
+    assert list(plot.axes[0].lines[0].get_xdata()) == [1]
+
+
+def test_residual_background():
+    solver = PGD(SquaredL2Norm(dim_shape=(8, )), show_progress=False)
+    solver.fit(mode=SolverMode.MANUAL,
+               x0=np.ones(8),
+               stop_crit=pxst.MaxIter(1))
+    metrics = IterationMetrics(1)
+    residuals = {}
+    for method in ('RL', 'GKL', 'Tikhonov', 'GLS'):
+        metrics._local.problem = (method,
+                                  HomothetyOp(dim_shape=(8, ), cst=2.),
+                                  np.full(8, 2.), 0.5)
+        residuals[method] = metrics.sample(solver, 1)['residual']
+    # bg is added to the data model of RL/GKL only (a lower bound of x otherwise)
+    assert residuals == {'RL': 0.25, 'GKL': 0.25, 'Tikhonov': 0., 'GLS': 0.}
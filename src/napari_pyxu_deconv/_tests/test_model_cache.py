@@ -0,0 +1,95 @@
+import importlib
+
+import torch
+
+from napari_pyxu_deconv import _model_cache
+from napari_pyxu_deconv._model_cache import ModelCache, model_nbytes
+
+
+def test_model_cache_hit():
+    cache = ModelCache()
+    key = ModelCache.make_key('model', 10, 'cpu')
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return torch.nn.Linear(4, 4)
+
+    model = cache.get(key, loader)
+    assert cache.get(key, loader) is model
+    assert len(calls) == 1
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_model_cache_key():
+    assert ModelCache.make_key('model', 10, 'cpu') != ModelCache.make_key(
+        'model', 20, 'cpu')
+    assert ModelCache.make_key('model', 10, 'cpu') != ModelCache.make_key(
+        'model', 10, 'cpu', torch.float64)
+
+
+def test_model_cache_eviction():
+    nbytes = model_nbytes(torch.nn.Linear(4, 4))
+    cache = ModelCache(budget=2 * nbytes)
+    keys = [ModelCache.make_key('model', epoch, 'cpu') for epoch in range(3)]
+    for key in keys:
+        cache.get(key, lambda: torch.nn.Linear(4, 4))
+    assert len(cache) == 2
+    assert keys[0] not in cache
+    assert cache.nbytes <= cache.budget
+
+
+class StubConv(torch.nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.ncalls = 0
+
+    def spectral_norm(self, mode="Fourier", n_steps=1000):
+        self.ncalls += 1
+        return 1.
+
+
+class StubModel(torch.nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.linear = torch.nn.Linear(4, 4)
+        self.conv_layer = StubConv()
+
+
+def test_install_routes_through_cache(monkeypatch, tmp_path):
+    loaded = []
+
+    def stub_loader(name, device, epoch, do3D, doSplineActivation):
+        loaded.append((name, epoch))
+        return StubModel(), None, None, None
+
+    modules = [
+        importlib.import_module(f'pyxudeconv.deconvolution.methods.{method}')
+        for method in _model_cache.LEARNED_METHODS
+    ]
+    for module in modules:
+        monkeypatch.setattr(module, 'load_model_weakly_convex',
+                            module.load_model_weakly_convex)
+    monkeypatch.setattr(_model_cache, '_ORIGINAL_LOADERS',
+                        {'GARL': stub_loader})
+    monkeypatch.setattr(_model_cache, 'MODEL_CACHE', ModelCache())
+    _model_cache.install()
+
+    model = _model_cache.preload(str(tmp_path), 10, 'cpu')
+    for module in modules:
+        # same call as in init_solver of the learned methods
+        out, *_ = module.load_model_weakly_convex(
+            str(tmp_path),
+            sigma=torch.tensor(5.),
+            device='cpu',
+            epoch=10,
+            do3D=True,
+            doSplineActivation=False,
+        )
+        assert out is model
+        out.conv_layer.spectral_norm(mode="power_method", n_steps=200)
+    assert loaded == [(str(tmp_path), 10)]
+    assert _model_cache.MODEL_CACHE.hits == len(modules)
+    assert model.conv_layer.ncalls == 1
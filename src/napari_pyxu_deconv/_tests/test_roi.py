@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from napari.layers import Image, Shapes
+
+from napari_pyxu_deconv._widget import (
+    Deconvolution,
+    channel_index,
+    rois_from_shapes,
+)
+
+
+def test_rois_from_shapes():
+    image = Image(np.zeros((4, 64, 64)), scale=(1, 0.5, 0.5))
+    shapes = Shapes(
+        [
+            np.array([[1, 2], [1, 6], [5, 6], [5, 2]]),
+            np.array([[10, 10], [12, 12], [10, 14]]),
+            np.array([[30, 28], [30, 40], [34, 40], [34, 28]]),
+            np.array([[40, 40], [40, 44], [44, 44], [44, 40]]),
+        ],
+        shape_type=['rectangle', 'polygon', 'rectangle', 'rectangle'],
+    )
+    rois = rois_from_shapes(shapes, image)
+    # partially outside: clipped, fully outside: skipped
+    assert rois == [(2, 4, 8, 8), (60, 56, 4, 8)]
+
+
+def test_clip_roi():
+    shape = (4, 64, 48)
+    assert Deconvolution.clip_roi((-1, -1, -1, -1), shape) == (0, 0, 64, 48)
+    assert Deconvolution.clip_roi((-1, -1, 10, 10), shape) == (27, 19, 10, 10)
+    assert Deconvolution.clip_roi((60, 40, 10, 10), shape) == (60, 40, 4, 8)
+
+
+SHAPES = {
+    "NZCYX": (3, 4, 2, 16, 20),
+    "NCZYX": (3, 2, 4, 16, 20),
+    "ZYX": (4, 16, 20),
+    "CZYX": (2, 4, 16, 20),
+    "NZYX": (3, 4, 16, 20),
+}
+
+
+@pytest.mark.parametrize("dim_order", list(SHAPES))
+def test_select_roi_view(dim_order):
+    data = np.random.random(SHAPES[dim_order])
+    roi = (2, 3, 8, 10)
+    out = Deconvolution.select_roi(data, roi, 0, dim_order)
+    assert np.shares_memory(out, data)
+    nviews = SHAPES[dim_order][0] if dim_order[0] == "N" else 1
+    expected = (nviews, 4, 8, 10) if nviews > 1 else (4, 8, 10)
+    assert out.shape == expected
+    if dim_order == "NZCYX":
+        np.testing.assert_array_equal(out, data[:, :, 0, 2:10, 3:13])
+    elif dim_order == "ZYX":
+        np.testing.assert_array_equal(out, data[:, 2:10, 3:13])
+
+
+def test_select_roi_channels():
+    data = np.random.random(SHAPES["NCZYX"][:1] + (4, ) +
+                            SHAPES["NCZYX"][2:])
+    out = Deconvolution.select_roi(data, (-1, -1, -1, -1), (1, 2), "NCZYX")
+    assert np.shares_memory(out, data)
+    np.testing.assert_array_equal(out, data.transpose(1, 0, 2, 3, 4)[1:3])
+    out = Deconvolution.select_roi(data, (-1, -1, -1, -1), (0, 1, 3),
+                                   "NCZYX")
+    assert not np.shares_memory(out, data)
+    assert out.shape == (3, *data.shape[:1], *data.shape[2:])
+    assert channel_index((0, 2, 4)) == slice(0, 5, 2)
+
+
+def test_select_roi_memmap(tmp_path):
+    data = np.lib.format.open_memmap(str(tmp_path / 'data.npy'),
+                                     mode='w+',
+                                     shape=SHAPES["NZYX"])
+    data[:] = 1.
+    out = Deconvolution.select_roi(data, (0, 0, 4, 4), 0, "NZYX")
+    assert np.shares_memory(out, data)
+
+
+def test_select_roi_lazy():
+    da = pytest.importorskip('dask.array')
+    data = np.random.random(SHAPES["NZCYX"])
+    out = Deconvolution.select_roi(da.from_array(data), (2, 3, 8, 10), 1,
+                                   "NZCYX")
+    np.testing.assert_array_equal(np.asarray(out), data[:, :, 1, 2:10, 3:13])
@@ -0,0 +1,70 @@
+import numpy as np
+
+from napari_pyxu_deconv._views import (
+    group_views,
+    reduce_views,
+    view_scores,
+    views_report,
+)
+
+
+def make_psf(nviews=6, shape=(3, 16, 16)):
+    """Gaussian PSFs shifted laterally, with decreasing energy"""
+    z, y, x = np.indices(shape)
+    psf = []
+    for v in range(nviews):
+        cy, cx = 8 + (v % 2) * 3, 8 + (v // 2) * 2
+        psf.append((nviews - v) * np.exp(-((y - cy)**2 + (x - cx)**2) / 4.) *
+                   np.ones_like(z))
+    return np.array(psf)
+
+
+def test_top_k_views():
+    psf = make_psf()
+    scores = view_scores(psf)
+    groups = group_views(psf, scores, 2, "Top-K views")
+    assert [g.tolist() for g in groups] == [[0], [1]]
+    assert reduce_views(psf, groups).shape == (2, *psf.shape[1:])
+
+
+def test_binned_views():
+    psf = make_psf()
+    data = np.random.default_rng(0).poisson(10 * psf).astype(float)
+    scores = view_scores(psf, data, "SNR")
+    groups = group_views(psf, scores, 3, "Binned views")
+    assert sorted(np.concatenate(groups).tolist()) == list(range(6))
+    binned = reduce_views(data, groups)
+    assert binned.shape[0] == len(groups)
+    sizes = np.array([g.size for g in groups])
+    np.testing.assert_allclose(np.tensordot(sizes, binned, axes=1),
+                               data.sum(axis=0))
+    report = views_report(psf, groups, data)
+    np.testing.assert_allclose(report['signal_kept'], 1.)
+    assert report['speedup_estimate'] == 6 / len(groups)
+
+
+def test_binned_views_scale():
+    # bins of 1 and 3 identical views: every virtual view keeps the scale of a single view
+    psf = np.stack([make_psf(1)[0]] * 4)
+    data = 5 * psf
+    groups = [np.array([0]), np.array([1, 2, 3])]
+    binned = reduce_views(data, groups)
+    np.testing.assert_allclose(binned, data[:2])
+    np.testing.assert_allclose(reduce_views(psf, groups), psf[:2])
+
+
+def test_signal_kept_snr_ranking():
+    psf = make_psf()
+    data = np.random.default_rng(0).poisson(10 * psf).astype(float)
+    scores = view_scores(psf, data, "SNR")
+    groups = group_views(psf, scores, 2, "Top-K views")
+    report = views_report(psf, groups, data)
+    kept = np.concatenate(groups)
+    np.testing.assert_allclose(report['signal_kept'],
+                               data[kept].sum() / data.sum())
+
+
+def test_all_views():
+    psf = make_psf()
+    groups = group_views(psf, view_scores(psf), 2, "All views")
+    assert len(groups) == psf.shape[0]
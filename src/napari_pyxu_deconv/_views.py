@@ -0,0 +1,123 @@
+"""
+View selection and view binning for multi-view (e.g., Airyscan) data.
+
+Each view adds one forward and one adjoint convolution per iteration. The
+views are ranked (PSF energy or SNR) and either the K best ones are kept,
+or neighbouring detector elements are binned into fewer virtual views.
+pyxudeconv rescales every PSF view to unit sum and normalizes the data by
+a single maximum, so each virtual view is the mean of the views of its bin
+(the mean of the measurements is the convolution of the object with the
+mean of their PSFs). Binned and single views thus keep the same scale,
+whatever the size of the bins.
+"""
+import numpy as np
+
+VIEW_MODES = ("All views", "Top-K views", "Binned views")
+VIEW_RANKINGS = ("PSF energy", "SNR")
+
+
+def view_scores(psf, data=None, ranking="PSF energy"):
+    """Score of each view (higher is better)
+
+    Args:
+        psf (numpy.ndarray): PSF with views along the first axis (N,Z,Y,X)
+        data (numpy.ndarray, optional): measurements with views along the first axis. Required for SNR.
+        ranking (str, optional): "PSF energy" or "SNR". Defaults to "PSF energy".
+
+    Returns:
+        numpy.ndarray: score of each view
+    """
+    axes = tuple(range(1, psf.ndim))
+    if ranking == "SNR":
+        # With Poisson noise, the SNR of a view grows with the square root of its photon count
+        return np.sqrt(np.maximum(np.sum(data, axis=axes), 0))
+    return np.sum(psf, axis=axes)
+
+
+def psf_centroids(psf):
+    """Lateral centroid (y,x) of the PSF of each view
+
+    Neighbouring detector elements have neighbouring PSF shifts.
+    """
+    proj = np.maximum(np.sum(psf, axis=1), 0)  #(N,Y,X)
+    proj = proj / np.maximum(proj.sum(axis=(-2, -1), keepdims=True), 1e-12)
+    yy, xx = np.indices(proj.shape[-2:])
+    return np.stack(
+        [(proj * yy).sum(axis=(-2, -1)), (proj * xx).sum(axis=(-2, -1))],
+        axis=-1,
+    )
+
+
+def group_views(psf, scores, nout, mode, niter=10):
+    """Indices of the views that make up each (virtual) view
+
+    Args:
+        psf (numpy.ndarray): PSF with views along the first axis (N,Z,Y,X)
+        scores (numpy.ndarray): score of each view, see :func:`view_scores`
+        nout (int): number of views to keep
+        mode (str): one of VIEW_MODES
+        niter (int, optional): number of k-means iterations for binning. Defaults to 10.
+
+    Returns:
+        list of numpy.ndarray: groups of views
+    """
+    nviews = psf.shape[0]
+    if mode == "All views" or nout <= 0 or nout >= nviews:
+        return [np.array([v]) for v in range(nviews)]
+    order = np.argsort(scores)[::-1]
+    if mode == "Top-K views":
+        return [np.array([v]) for v in np.sort(order[:nout])]
+
+    # Binned views: weighted k-means on the PSF centroids, seeded with the best views
+    centroids = psf_centroids(psf)
+    weights = np.maximum(scores, 1e-12)
+    seeds = centroids[order[:nout]].copy()
+    labels = np.zeros(nviews, dtype=int)
+    for _ in range(niter):
+        dist = np.linalg.norm(centroids[:, None] - seeds[None], axis=-1)
+        labels = np.argmin(dist, axis=1)
+        for b in range(nout):
+            members = labels == b
+            if np.any(members):
+                seeds[b] = np.average(centroids[members],
+                                      axis=0,
+                                      weights=weights[members])
+    groups = [np.flatnonzero(labels == b) for b in range(nout)]
+    groups = [g for g in groups if g.size > 0]
+    return sorted(groups, key=lambda g: g[0])
+
+
+def reduce_views(arr, groups):
+    """Average the views of each group (views along the first axis)"""
+    if all(g.size == 1 for g in groups):
+        return arr[np.concatenate(groups)]
+    return np.stack([arr[g].mean(axis=0) for g in groups])
+
+
+def views_report(psf, groups, data=None):
+    """Quality/speed trade-off of a view reduction
+
+    Args:
+        psf (numpy.ndarray): PSF with views along the first axis (N,Z,Y,X)
+        groups (list of numpy.ndarray): groups of views, see :func:`group_views`
+        data (numpy.ndarray, optional): measurements with views along the first axis. Defaults to None.
+
+    Returns:
+        dict: number of views, estimated per-iteration speedup (ratio of the number of convolutions), fraction of the signal kept (photons of data if given, PSF energy otherwise) and largest lateral spread (pixels) of the PSFs binned together
+    """
+    nviews = psf.shape[0]
+    kept = np.concatenate(groups)
+    signal = np.sum(psf if data is None else data,
+                    axis=tuple(range(1, psf.ndim)))
+    centroids = psf_centroids(psf)
+    spread = max([
+        float(np.linalg.norm(centroids[g] - centroids[g].mean(axis=0),
+                             axis=-1).max()) for g in groups
+    ])
+    return {
+        'nviews_in': int(nviews),
+        'nviews_out': len(groups),
+        'speedup_estimate': nviews / len(groups),
+        'signal_kept': float(signal[kept].sum() / np.sum(signal)),
+        'bin_spread_px': spread,
+    }
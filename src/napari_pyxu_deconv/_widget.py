@@ -23,7 +23,7 @@ from typing import TYPE_CHECKING
 from magicgui import widgets
 from magicgui.widgets import Container, create_widget
 #from qtpy.QtWidgets import QHBoxLayout, QPushButton, QWidget
-from skimage.util import img_as_float
+from skimage.util import img_as_float32
 import os
 import json
 import pyxudeconv as pd
@@ -35,15 +35,131 @@ if TYPE_CHECKING:
 from napari.utils.notifications import show_info
 from argparse import Namespace
 
+import contextlib
 import gc
+from concurrent.futures import ThreadPoolExecutor
+import time
 import torch
 import cupy as cp
 
+from . import _model_cache
+from ._background import BackgroundCache, estimate_background
+from . import _views
+from ._cpu_profile import cpu_profile, parse_cores
+from ._metrics import IterationMetrics, MetricsPlot
+
 NGPU = cp.cuda.runtime.getDeviceCount()
 
 #NGPU = torch.cuda.device_count()
 
 
+BG_LABEL = "Background (minimum value).\nIf smaller than 0, automatically chosen."
+
+#Cheaper settings tried, in order, after an out-of-memory error
+#(pyxudeconv already casts the inputs to float32)
+FALLBACKS = {
+    'tiled': 'a tiled problem',
+    'cpu': 'CPU',
+}
+
+OOM_ERRORS = (MemoryError, RuntimeError, cp.cuda.memory.OutOfMemoryError)
+
+
+def is_oom(error):
+    """Whether an exception is an allocation failure (host, CuPy or torch)"""
+    if isinstance(error, (MemoryError, cp.cuda.memory.OutOfMemoryError)):
+        return True
+    return 'out of memory' in str(error).lower()
+
+
+def free_memory():
+    """Release the memory pools of CuPy and torch"""
+    gc.collect()
+    cp._default_memory_pool.free_all_blocks()
+    cp._default_pinned_memory_pool.free_all_blocks()
+    torch.cuda.empty_cache()
+
+
+def method_devices(param):
+    """Methods to run on each device
+
+    Several methods are distributed over the available GPUs, starting from the selected one.
+
+    Args:
+        param (dict): parameters with keys 'gpu' and 'methods'
+
+    Returns:
+        dict: gpu -> list of methods
+    """
+    if param['gpu'] < 0 or NGPU <= 1 or len(param['methods']) == 1:
+        return {param['gpu']: list(param['methods'])}
+    ndevices = min(NGPU, len(param['methods']))
+    gpus = [(param['gpu'] + k) % NGPU for k in range(ndevices)]
+    devices = {gpu: [] for gpu in gpus}
+    for k, method in enumerate(param['methods']):
+        devices[gpus[k % ndevices]].append(method)
+    return devices
+
+
+#Permutation to "CNZYX" and index creating the missing singleton dimensions
+DIM_ORDERS = {
+    "NZCYX": ((2, 0, 1, 3, 4), None),
+    "NCZYX": ((1, 0, 2, 3, 4), None),
+    "ZYX": ((0, 1, 2), (None, None, Ellipsis)),
+    "CZYX": ((0, 1, 2, 3), (slice(None), None, Ellipsis)),
+    "NZYX": ((0, 1, 2, 3), (None, Ellipsis)),
+}
+
+
+def channel_index(coi):
+    """Index selecting the channel(s) of interest
+
+    Args:
+        coi (int or tuple of int): channel(s) of interest
+
+    Returns:
+        int, slice or numpy.ndarray: int for a single channel, slice for a regular range of channels, array otherwise (advanced indexing copies data)
+    """
+    coi = np.atleast_1d(np.asarray(coi, dtype=int)).ravel()
+    if coi.size == 1:
+        return int(coi[0])
+    step = coi[1] - coi[0]
+    if step > 0 and np.all(np.diff(coi) == step):
+        return slice(int(coi[0]), int(coi[-1]) + 1, int(step))
+    return coi
+
+
+def rois_from_shapes(shapes_layer, image_layer):
+    """Lateral regions of interest of the rectangles of a Shapes layer
+
+    Args:
+        shapes_layer (napari.layers.Shapes): layer containing the rectangles
+        image_layer (napari.layers.Image): measurements in which the ROIs are selected
+
+    Returns:
+        list of 4-tuple of int: regions of interest (x0,y0,w,h) in the pixel coordinates of image_layer, following the convention of :func:`Deconvolution.select_roi`
+    """
+    rois = []
+    for vertices, shape_type in zip(shapes_layer.data,
+                                    shapes_layer.shape_type):
+        if shape_type != 'rectangle':
+            continue
+        # shapes data -> world -> measurements data (lateral axes only)
+        world = vertices[:, -2:] * np.array(
+            shapes_layer.scale[-2:]) + np.array(shapes_layer.translate[-2:])
+        pix = (world - np.array(image_layer.translate[-2:])) / np.array(
+            image_layer.scale[-2:])
+        start = np.floor(pix.min(axis=0)).astype(int)
+        stop = np.ceil(pix.max(axis=0)).astype(int)
+        #clip to the field of view, rectangles outside of it are skipped
+        start = np.maximum(start, 0)
+        stop = np.minimum(stop, image_layer.data.shape[-2:])
+        if np.any(stop - start <= 0):
+            continue
+        rois.append((*map(int, start), *map(int, stop - start)))
+    return rois
+
+
 # if we want even more control over our widget, we can use
 # magicgui `Container`
 class Deconvolution(Container):
@@ -53,6 +169,7 @@ class Deconvolution(Container):
 
     def __init__(self, viewer: "napari.viewer.Viewer"):
         super().__init__()
+        _model_cache.install()  #trained models are loaded once per process
         self._old_method = ''
         self.saved_values_dynamic = {
             "RL": {},
@@ -92,6 +209,12 @@ class Deconvolution(Container):
         self.static_container = Container()
         self.dynamic_container = Container()
         self._maxC = 0
+        self._run_layers = []  #result layers added by the current run
+        self._metrics_plot = None
+        self._comparison_table = None
+        self._comparison_rows = []  #one row per ROI of the current run
+        self._bg_cache = BackgroundCache()
+        self._viewer.layers.events.removed.connect(self._on_layer_removed)
         self._set_widgets()
         self.max_width = 500  #not nice to hard-code
 
@@ -177,12 +300,18 @@ class Deconvolution(Container):
 
         self._bg_layer = widgets.FloatSpinBox(
             name='bg',
-            label=
-            "Background (minimum value).\nIf smaller than 0, automatically chosen.",
+            label=BG_LABEL,
             value=self.values_from_param_file.get('bg', -1),
             min=-1,
             step=1,
         )
+        self._bgestimate_layer = widgets.PushButton(
+            name='bgestimate',
+            label='Estimate background',
+            tooltip=
+            'Estimate the background of the region of interest (with the selected views) and show it above.\nEstimates are cached per layer and ROI and reused when running.',
+        )
+        self._bgestimate_layer.clicked.connect(self.estimate_bg)
 
         self._nepoch_layer = widgets.SpinBox(
             name='Nepoch',
@@ -199,6 +328,16 @@ class Deconvolution(Container):
             step=1,
         )
 
+        self._metrics_layer = widgets.SpinBox(
+            name='metrics',
+            label="Metrics frequency",
+            value=self.values_from_param_file.get('metrics', 0),
+            min=0,
+            step=1,
+            tooltip=
+            'Plot convergence metrics (data-fit residual, relative update, objective) every N iterations.\n0 disables the metrics.',
+        )
+
         self._method_layer = widgets.ComboBox(
             name='methods',
             label="Deconvolution method",
@@ -299,6 +438,21 @@ class Deconvolution(Container):
             labels=False,
         )
 
+        self._roishapes_layer = create_widget(
+            name='roishapes',
+            label="ROIs from Shapes layer",
+            annotation="napari.layers.Shapes",
+            value=None,
+            options={
+                "nullable":
+                True,
+                "visible":
+                False,
+                "tooltip":
+                'Deconvolve every rectangle of the Shapes layer. Overrides the region of interest.',
+            },
+        )
+
         # ROI PSF
         self._psfroix_layer = widgets.SpinBox(
             name='psfroix',
@@ -344,6 +498,97 @@ class Deconvolution(Container):
             labels=False,
         )
 
+        # View selection / binning (multi-view data)
+        self._viewmode_layer = widgets.ComboBox(
+            name='viewmode',
+            label="Views",
+            choices=list(_views.VIEW_MODES),
+            value=self.values_from_param_file.get('viewmode', "All views"),
+            tooltip=
+            'Keep the K best views or bin neighbouring detector elements into K virtual views.\nFewer views means faster iterations.',
+            visible=False,
+        )
+        self._nviewsel_layer = widgets.SpinBox(
+            name='nviewsel',
+            label="K",
+            value=self.values_from_param_file.get('nviewsel', 8),
+            min=1,
+            step=1,
+            visible=False,
+        )
+        self._viewrank_layer = widgets.ComboBox(
+            name='viewrank',
+            label="Ranking",
+            choices=list(_views.VIEW_RANKINGS),
+            value=self.values_from_param_file.get('viewrank', "PSF energy"),
+            visible=False,
+        )
+
+        # CPU execution profile
+        self._threads_layer = widgets.SpinBox(
+            name='threads',
+            label="Threads",
+            value=self.values_from_param_file.get('threads', 0),
+            min=0,
+            max=os.cpu_count(),
+            step=1,
+        )
+        self._fftworkers_layer = widgets.SpinBox(
+            name='fftworkers',
+            label="FFT workers",
+            value=self.values_from_param_file.get('fftworkers', 0),
+            min=0,
+            max=os.cpu_count(),
+            step=1,
+        )
+        self._cores_layer = widgets.LineEdit(
+            name='cores',
+            label="Cores",
+            value=self.values_from_param_file.get('cores', ''),
+        )
+        self._cpuprofile_layer = Container(
+            name='cpuprofile',
+            layout='horizontal',
+            widgets=[
+                self._threads_layer,
+                self._fftworkers_layer,
+                self._cores_layer,
+            ],
+            label='CPU profile',
+            tooltip=
+            'Used when running on CPU (GPU = -1 or out-of-memory retry on CPU).\nThreads: intra-op threads of torch and BLAS. FFT workers: threads of the FFTs (by default, same as threads).\nCores: core affinity, e.g., 0-7 or 0,2,4. Empty keeps the default.\nThreads and FFT workers: 0 keeps the default.',
+            visible=False,
+        )
+
+        self._oomretry_layer = widgets.CheckBox(
+            name='oomretry',
+            value=self.values_from_param_file.get('oomretry', True),
+            text='Retry with cheaper settings if out of memory',
+            tooltip=
+            'On out-of-memory errors, retry tile by tile, then on CPU.\nDowngrades are reported in the layer metadata.',
+            visible=False,
+        )
+
+        self._compare_layer = widgets.Select(
+            name='compare',
+            label="Compare methods",
+            choices=["RL", "GARL", "Tikhonov", "GLS", "GKL", "RLTV"],
+            value=self.values_from_param_file.get('compare', []),
+            tooltip=
+            'Select two or more methods to compare them in one run (overrides the deconvolution method).\nEach method uses the parameters last set when it was selected as deconvolution method.\nThe results are stacked in one layer and summarized in a table.',
+            visible=False,
+        )
+
+        self._preload_layer = widgets.CheckBox(
+            name='preload_model',
+            value=self.values_from_param_file.get('preload_model', False),
+            text='Pre-load trained model',
+            tooltip=
+            'Load the trained model (GARL, GLS, GKL) as soon as the method is selected.\nTrained models are cached across runs.',
+            visible=False,
+        )
+        self._preload_layer.changed.connect(self.preload_model)
+
         # append into/extend the container with your widgets
         self.static_container.extend([
             self._param_layer,
@@ -354,14 +599,37 @@ class Deconvolution(Container):
             self._coi_layer,
             self._gpu_layer,
             self._bg_layer,
+            self._bgestimate_layer,
             self._nepoch_layer,
             self._disp_layer,
+            self._metrics_layer,
             self._advanced_layer,
             self._bufferwidth_layer,
             self._roi_layer,
+            self._roishapes_layer,
             self._psfroi_layer,
+            self._viewmode_layer,
+            self._nviewsel_layer,
+            self._viewrank_layer,
+            self._cpuprofile_layer,
+            self._oomretry_layer,
+            self._compare_layer,
+            self._preload_layer,
             self._method_layer,
         ])
+        for cwidget in [
+                self._bg_layer,
+                self._coi_layer,
+                self._dim_order_layer,
+                self._airyscan_layer,
+                self._viewmode_layer,
+                self._nviewsel_layer,
+                self._viewrank_layer,
+                *self._roi_layer,
+        ]:
+            cwidget.changed.connect(self.update_bg_label)
+        self.update_bg_label()
+
         self.clear()
         self.extend(self.static_container)
         self.update_dynamic_layout(self._method_layer.value)
@@ -386,6 +654,7 @@ class Deconvolution(Container):
                     self._dim_order_layer.value = "ZYX"
 
         self._on_metadata_change()
+        self._on_advanced_change()
 
     def _on_meas_change(self):
         if self._image_layer_meas.value is not None:
@@ -398,7 +667,18 @@ class Deconvolution(Container):
                     self._dim_order_layer.value = "ZYX"
                 elif ndim_meas == 4:
                     self._dim_order_layer.value = "CZYX"
+            # estimates of replaced data are dropped
+            self._image_layer_meas.value.events.data.connect(
+                self._on_meas_data_change)
         self._on_metadata_change()
+        self.update_bg_label()
+
+    def _on_meas_data_change(self, event):
+        self._bg_cache.discard(event.source)
+        self.update_bg_label()
+
+    def _on_layer_removed(self, event):
+        self._bg_cache.discard(event.value)
 
     def _on_metadata_change(self):
         self.update_max_channels()
@@ -420,14 +700,30 @@ class Deconvolution(Container):
         """
         Callback function to handle advanced options change and update the parameters accordingly.
         """
+        for cwidget in [
+                self._viewmode_layer,
+                self._nviewsel_layer,
+                self._viewrank_layer,
+        ]:
+            cwidget.visible = self._advanced_layer.value and self._airyscan_layer.value
         if self._advanced_layer.value:
             self._bufferwidth_layer.visible = True
             self._roi_layer.visible = True
+            self._roishapes_layer.visible = True
             self._psfroi_layer.visible = True
+            self._preload_layer.visible = True
+            self._oomretry_layer.visible = True
+            self._cpuprofile_layer.visible = True
+            self._compare_layer.visible = True
         else:
             self._bufferwidth_layer.visible = False
             self._roi_layer.visible = False
+            self._roishapes_layer.visible = False
             self._psfroi_layer.visible = False
+            self._preload_layer.visible = False
+            self._oomretry_layer.visible = False
+            self._cpuprofile_layer.visible = False
+            self._compare_layer.visible = False
 
     def _on_run(self):
         """
@@ -445,14 +741,12 @@ class Deconvolution(Container):
                     show_info('Please specify the PSF and the measurements')
                     return 0
                 else:
-                    param[cwidget.name] = img_as_float(cwidget.value.data)
+                    #converted to float after the ROI selection
+                    param[cwidget.name] = cwidget.value.data
             else:
                 param[cwidget.name] = cwidget.value
         if param['datapath'].ndim == 3:
             param['nviews'] = 1
-        param['create_fname'] = lambda x, y, z: self.create_fname(
-            x, y, self._image_layer_meas.value.name, z)
-        param['save_results'] = self.save_results
         param['fres'] = ''
         param['saveMeas'] = False
         param['methods'] = [param['methods']]
@@ -462,103 +756,595 @@ class Deconvolution(Container):
         param['normalize_meas'] = True
         if param['bg'] == 0:
             param['bg'] = 1e-9
+        if param['gpu'] < 0 or param['oomretry']:
+            #CPU run, possibly after an out-of-memory error on GPU
+            try:
+                parse_cores(param['cpuprofile'][2])
+            except ValueError as e:
+                show_info(str(e))
+                return 0
         if np.ndim(param['datapath']) == 3:
             self._dim_order_layer.value = "ZYX"
         elif np.ndim(param['datapath']) == 4 and self._airyscan_layer.value:
             self._dim_order_layer.value = "NZYX"
 
-        param['datapath'] = self.select_roi(param['datapath'], param['roi'],
-                                            param['coi'],
-                                            self._dim_order_layer.value)
-        param['psfpath'] = self.select_roi(param['psfpath'], param['psf_sz'],
-                                           param['coi'],
-                                           self._dim_order_layer.value)
+        #PSF is prepared once, even if several ROIs are deconvolved
+        data = param['datapath']
+        param['psfpath'] = img_as_float32(
+            np.asarray(
+                self.select_roi(param['psfpath'], param['psf_sz'],
+                                param['coi'], self._dim_order_layer.value)))
 
         #add dynamic layers
-        config_meth = 'config_' + param['methods'][0]
-        param[config_meth] = dict()
-        for cwidget in self.dynamic_container:
+        if len(param['compare']) > 1:
+            param['methods'] = list(param['compare'])
+            self._comparison_rows = []
+        for method in param['methods']:
+            config = self.get_config(method)
+            if config is None:
+                return 0
+            param['config_' + method] = config
+
+        if param['roishapes'] is None:
+            rois = [param['roi']]
+        else:
+            rois = rois_from_shapes(param['roishapes'],
+                                    self._image_layer_meas.value)
+            if len(rois) == 0:
+                show_info('No rectangle in the selected Shapes layer')
+                return 0
+        # Same-sized ROIs are processed one after the other so that FFT plans
+        # and solver buffers of the same shape are reused.
+        order = sorted(range(len(rois)), key=lambda k: rois[k][2:])
+
+        methods_str = ', '.join(param['methods'])
+        show_info(f'Starting Deconvolution with {methods_str}...')
+        # the metrics plot processes GUI events during the run: the controls
+        # are disabled to prevent re-entrant runs and layout changes
+        self.enabled = False
+        try:
+            for k in order:
+                cparam = param.copy()
+                roi = self.clip_roi(rois[k], data.shape)
+                cparam['roi'] = roi
+                cparam['datapath'] = img_as_float32(
+                    np.asarray(
+                        self.select_roi(data, roi, param['coi'],
+                                        self._dim_order_layer.value)))
+                metadata = {'roi': roi}
+                if self._airyscan_layer.value and param[
+                        'viewmode'] != "All views" and cparam[
+                            'datapath'].ndim == 4:
+                    (cparam['datapath'], cparam['psfpath'],
+                     report) = self.reduce_views(cparam['datapath'],
+                                                 param['psfpath'],
+                                                 param['viewmode'],
+                                                 param['nviewsel'],
+                                                 param['viewrank'])
+                    metadata['views'] = report
+                if param['bg'] < 0:
+                    cparam['bg'] = max(
+                        self.background_estimate(
+                            roi, param['coi'],
+                            lambda data=cparam['datapath']: data), 1e-9)
+                    metadata['bg'] = cparam['bg']
+                fid = self._image_layer_meas.value.name
+                if len(rois) > 1:
+                    fid = f'{fid}_roi_{k}'
+                self.deconvolve(cparam, roi, fid, metadata)
+        finally:
+            self.enabled = True
+        show_info(f'Deconvolution with {methods_str} done!')
+
+    def bg_cache_key(self, roi, coi):
+        """Key of the background estimate of a ROI of the measurements with the selected views
+
+        Args:
+            roi (4-tuple of int): region of interest, see :func:`select_roi`
+            coi (int or tuple of int): channel of interest
+
+        Returns:
+            tuple: key of :class:`BackgroundCache` for the measurements layer
+        """
+        layer = self._image_layer_meas.value
+        views = ("All views", )
+        if self._airyscan_layer.value and self._viewmode_layer.value != (
+                "All views"):
+            views = (self._viewmode_layer.value, self._nviewsel_layer.value,
+                     self._viewrank_layer.value)
+        return (
+            self.clip_roi(roi, layer.data.shape),
+            coi,
+            self._dim_order_layer.value,
+            views,
+        )
+
+    def background_estimate(self, roi, coi, load):
+        """Fast background estimate of the measurements, cached per layer, ROI and view selection
+
+        Args:
+            roi (4-tuple of int): region of interest, see :func:`select_roi`
+            coi (int or tuple of int): channel of interest
+            load (callable): returns the selected (and view-reduced) measurements (Z,Y,X) or (N,Z,Y,X). Only called if not cached.
+
+        Returns:
+            float: background relative to the maximum of the measurements
+        """
+
+        def estimate():
+            data = load()
+            return estimate_background(data,
+                                       has_views=self._airyscan_layer.value
+                                       and np.ndim(data) == 4)
+
+        return self._bg_cache.get(self._image_layer_meas.value,
+                                  self.bg_cache_key(roi, coi), estimate)
+
+    def estimate_bg(self):
+        """
+        Estimate the background of the current ROI with the selected views (on demand) and show it in the background widget.
+        """
+        layer = self._image_layer_meas.value
+        if layer is None:
+            show_info('Please specify the measurements')
+            return
+        roi = self.clip_roi(tuple(cw.value for cw in self._roi_layer),
+                            layer.data.shape)
+        coi = self._coi_layer.value
+        dim_order = self._dim_order_layer.value
+
+        def load():
+            data = img_as_float32(
+                np.asarray(self.select_roi(layer.data, roi, coi, dim_order)))
+            if self._airyscan_layer.value and self._viewmode_layer.value != (
+                    "All views") and data.ndim == 4:
+                if self._image_layer_psf.value is None:
+                    raise ValueError('the PSF is required to select the views')
+                psf = img_as_float32(
+                    np.asarray(
+                        self.select_roi(
+                            self._image_layer_psf.value.data,
+                            tuple(cw.value for cw in self._psfroi_layer), coi,
+                            dim_order)))
+                data, _, _ = self.reduce_views(data, psf,
+                                               self._viewmode_layer.value,
+                                               self._nviewsel_layer.value,
+                                               self._viewrank_layer.value)
+            return data
+
+        try:
+            self.background_estimate(roi, coi, load)
+        except (ValueError, IndexError, KeyError) as e:
+            show_info(f'Could not estimate the background: {e}')
+            return
+        self.update_bg_label()
+
+    def update_bg_label(self):
+        """
+        Show the cached background estimate of the current ROI and view selection in the background widget.
+        Nothing is computed here (see :func:`estimate_bg`).
+        """
+        self._bgestimate_layer.enabled = self._bg_layer.value < 0
+        layer = self._image_layer_meas.value
+        bg = None
+        if self._bg_layer.value < 0 and layer is not None:
+            roi = tuple(cw.value for cw in self._roi_layer)
+            bg = self._bg_cache.peek(
+                layer, self.bg_cache_key(roi, self._coi_layer.value))
+        if bg is None:
+            self._bg_layer.label = BG_LABEL
+        else:
+            self._bg_layer.label = f'{BG_LABEL}\nEstimate: {bg:.3e}'
+
+    def get_config(self, method):
+        """Parameters of a method for pyxudeconv, taken from the dynamic widgets
+
+        Args:
+            method (str): method name
+
+        Returns:
+            dict: configuration of the method (None if invalid)
+        """
+        if method == self._method_layer.value:
+            cwidgets = list(self.dynamic_container)
+        else:
+            cwidgets = self.create_dynamic_widgets(method)
+        config = {}
+        for cwidget in cwidgets:
             cval = cwidget.value
             if not isinstance(cwidget,
                               widgets.Label) and cwidget.name != 'run':
                 if isinstance(cval, (float, int, str)):
-                    param[config_meth][cwidget.name] = (cval, )
+                    config[cwidget.name] = (cval, )
                 elif isinstance(cval, pathlib.PurePath):
                     if str(cval).lower() == 'default model':
-                        param[config_meth][cwidget.name] = ('', )
+                        config[cwidget.name] = ('', )
                     elif not cval.exists():
                         show_info(f'Folder {cval} does not exist')
-                        return 0
+                        return None
                     else:
-                        param[config_meth][cwidget.name] = (str(cval), )
+                        config[cwidget.name] = (str(cval), )
                 else:
-                    param[config_meth][cwidget.name] = cval
+                    config[cwidget.name] = cval
+        return config
 
-        param = Namespace(**param)
+    def deconvolve(self, param, roi, fid, metadata):
+        """Run the deconvolution of one ROI.
 
-        show_info(f'Starting Deconvolution with {self._method_layer.value}...')
-        ims = pd.deconvolve(param)
-        del ims
-        gc.collect()
-        cp._default_memory_pool.free_all_blocks()
-        torch.cuda.empty_cache()
-        show_info(f'Deconvolution with {self._method_layer.value} done!')
+        If enabled, out-of-memory errors are caught and the deconvolution is retried with
+        progressively cheaper settings (see FALLBACKS). Downgrades are recorded in metadata.
 
-    def select_roi(self, data, roi, coi, dim_order):
+        Args:
+            param (dict): parameters for pyxudeconv
+            roi (4-tuple of int): region of interest of param['datapath']
+            fid (str): File ID for the result layers
+            metadata (dict): stored in the result layers metadata
+        """
+        fallbacks = []
+        steps = list(FALLBACKS) if param['oomretry'] else []
+        while True:
+            self._run_layers = []  #result layers of this attempt (all tiles)
+            try:
+                if 'tiled' in fallbacks:
+                    for tile, tile_roi in enumerate(
+                            self.tile_roi(roi, param['datapath'].shape)):
+                        tparam = param.copy()
+                        tparam['datapath'] = param['datapath'][
+                            ..., tile_roi[0] - roi[0]:tile_roi[0] - roi[0] +
+                            tile_roi[2], tile_roi[1] - roi[1]:tile_roi[1] -
+                            roi[1] + tile_roi[3]]
+                        tmetadata = metadata
+                        if 'bg' in metadata:
+                            # the automatic background is relative to the maximum of the ROI,
+                            # whereas pyxudeconv normalizes each tile by its own maximum
+                            tmetadata = dict(metadata)
+                            tmetadata['bg'] = tparam['bg'] = self.tile_bg(
+                                param['bg'], param['datapath'],
+                                tparam['datapath'])
+                        self._deconvolve(tparam, tile_roi,
+                                         f'{fid}_tile_{tile}', tmetadata)
+                else:
+                    self._deconvolve(param, roi, fid, metadata)
+                return
+            except OOM_ERRORS as e:
+                if not is_oom(e):
+                    raise
+                # remove partial results before retrying
+                for layer in self._run_layers:
+                    if layer in self._viewer.layers:
+                        self._viewer.layers.remove(layer)
+                self._run_layers = []
+                _model_cache.MODEL_CACHE.clear()
+                free_memory()
+                if param['gpu'] < 0:
+                    steps = [step for step in steps if step != 'cpu']
+                if len(steps) == 0:
+                    raise
+                step = steps.pop(0)
+                fallbacks.append(step)
+                metadata['fallbacks'] = list(fallbacks)
+                show_info(
+                    f'Out of memory ({type(e).__name__}). Retrying with {FALLBACKS[step]}...'
+                )
+                if step == 'cpu':
+                    param = param.copy()
+                    param['gpu'] = -1
+
+    def _deconvolve(self, param, roi, fid, metadata):
+        translate = self.roi_translate(roi)
+        compare = len(param['methods']) > 1
+        results = []  #collected in comparison mode, added once all methods are done
+
+        def save_results(vol, fname, pxsz, unit):
+            if compare:
+                results.append((np.asarray(vol), fname, pxsz, unit))
+            else:
+                self.save_results(vol,
+                                  fname,
+                                  pxsz,
+                                  unit,
+                                  translate=translate,
+                                  metadata=metadata)
+
+        if param['gpu'] < 0:
+            profile = cpu_profile(*param['cpuprofile'])
+            metadata['cpuprofile'] = param['cpuprofile']
+        else:
+            profile = contextlib.nullcontext()
+        devices = method_devices(param)
+        if param['metrics'] > 0:
+            if self._metrics_plot is None:
+                self._metrics_plot = MetricsPlot()
+                self._viewer.window.add_dock_widget(
+                    self._metrics_plot, name='Convergence metrics')
+            # the plot can only be updated from the GUI thread
+            metrics = IterationMetrics(
+                param['metrics'], self._metrics_plot.update_plot
+                if len(devices) == 1 else None)
+        elif compare:
+            # final data-fit residual and timing of each method
+            metrics = IterationMetrics(param['Nepoch'])
+        else:
+            metrics = contextlib.nullcontext()
+        first = len(self._run_layers)
+        t0 = time.perf_counter()
+        with profile, metrics:
+            self.run_methods(param, devices, fid, save_results)
+        metadata['runtime'] = time.perf_counter() - t0
+        if param['metrics'] > 0:
+            metadata['metrics'] = metrics.history
+        if compare:
+            self.add_comparison(results, metrics, fid, translate, metadata)
+        for layer in self._run_layers[first:]:
+            layer.metadata.update(metadata)
+        free_memory()
+
+    def run_methods(self, param, devices, fid, save_results):
+        """Run pyxudeconv for the methods in param
+
+        Methods sharing a device are run in a single call to share the preprocessing.
+        Devices (GPUs) are used concurrently.
+
+        Args:
+            param (dict): parameters for pyxudeconv
+            devices (dict): methods to run on each device, see :func:`method_devices`
+            fid (str): File ID for the result layers
+            save_results (callable): called with each result
+        """
+
+        def run(gpu, methods):
+            cparam = param.copy()
+            cparam['gpu'] = gpu
+            cparam['methods'] = list(methods)
+            for method in methods:
+                cparam['config_' + method] = param['config_' + method].copy()
+            cparam['create_fname'] = (
+                lambda x, y, z: self.create_fname(x, y, fid, z))
+            cparam['save_results'] = save_results
+            ims = pd.deconvolve(Namespace(**cparam))
+            del ims
+
+        if len(devices) == 1:
+            run(*next(iter(devices.items())))
+        else:
+            with ThreadPoolExecutor(max_workers=len(devices)) as pool:
+                futures = [
+                    pool.submit(run, gpu, methods)
+                    for gpu, methods in devices.items()
+                ]
+                for future in futures:
+                    future.result()
+
+    def add_comparison(self, results, metrics, fid, translate, metadata):
+        """Add the results of a comparison of methods: intermediate results, final results stacked
+        in a single layer (first axis) and a timing/quality summary table
+
+        Args:
+            results (list of tuple): (volume, fname, pxsz, unit) saved during the run
+            metrics (IterationMetrics): metrics collected during the run
+            fid (str): File ID
+            translate (tuple of float): world position (Z,Y,X) of the volumes
+            metadata (dict): stored in the layers metadata
+        """
+        finals = []
+        for vol, fname, pxsz, unit in results:
+            if fname.endswith('_last'):
+                finals.append((vol, fname, pxsz, unit))
+            else:
+                self.save_results(vol,
+                                  fname,
+                                  pxsz,
+                                  unit,
+                                  translate=translate,
+                                  metadata=metadata)
+        if len(finals) == 0:
+            return
+        summary = []
+        for _, fname, _, _ in finals:
+            method = fname.split('_')[0]
+            history = [h for h in metrics.history if h.get('method') == method]
+            summary.append({
+                'method': method,
+                'time (s)': round(metrics.timings.get(method, np.nan), 2),
+                'residual': history[-1].get('residual', np.nan)
+                if len(history) > 0 else np.nan,
+                'iterations': history[-1]['iteration']
+                if len(history) > 0 else np.nan,
+                'layer index': len(summary),
+            })
+        metadata['comparison'] = summary
+        shapes = {vol.shape for vol, *_ in finals}
+        if len(shapes) == 1:
+            self.save_results(
+                np.stack([vol for vol, *_ in finals]),
+                f'Comparison_{fid}',
+                finals[0][2],
+                finals[0][3],
+                translate=translate,
+                metadata=metadata,
+            )
+        else:
+            for vol, fname, pxsz, unit in finals:
+                self.save_results(vol,
+                                  fname,
+                                  pxsz,
+                                  unit,
+                                  translate=translate,
+                                  metadata=metadata)
+        self.update_comparison_table(fid, summary)
+
+    def update_comparison_table(self, fid, summary):
+        """Add the summary of a comparison as a row (one per ROI) of the comparison table
+
+        Args:
+            fid (str): File ID of the ROI
+            summary (list of dict): timing and quality of each method
+        """
+        row = {'ROI': fid}
+        for entry in summary:
+            row[f'{entry["method"]} time (s)'] = entry['time (s)']
+            row[f'{entry["method"]} residual'] = entry['residual']
+        self._comparison_rows.append(row)
+        if self._comparison_table is not None:
+            try:
+                self._comparison_table.value = self._comparison_rows
+                return
+            except RuntimeError:  #closed by the user
+                pass
+        self._comparison_table = widgets.Table(value=self._comparison_rows)
+        self._viewer.window.add_dock_widget(self._comparison_table,
+                                            name='Comparison')
+
+    @staticmethod
+    def tile_roi(roi, shape, ntiles=2):
+        """Split a lateral region of interest into ntiles x ntiles tiles
+
+        Args:
+            roi (4-tuple of int): region of interest as returned by :func:`clip_roi`
+            shape (tuple of int): shape of the data selected with roi
+            ntiles (int, optional): number of tiles along each lateral axis. Defaults to 2.
+
+        Returns:
+            list of 4-tuple of int: tiles
+        """
+        tiles = []
+        edges = [
+            np.linspace(0, shape[d], ntiles + 1).astype(int) for d in (-2, -1)
+        ]
+        for y0, y1 in zip(edges[0][:-1], edges[0][1:]):
+            for x0, x1 in zip(edges[1][:-1], edges[1][1:]):
+                if y1 > y0 and x1 > x0:
+                    tiles.append((roi[0] + int(y0), roi[1] + int(x0),
+                                  int(y1 - y0), int(x1 - x0)))
+        return tiles
+
+    @staticmethod
+    def tile_bg(bg, data, tile):
+        """Background relative to the maximum of a tile
+
+        Args:
+            bg (float): background relative to the maximum of data
+            data (numpy.ndarray): measurements
+            tile (numpy.ndarray): tile of data
+
+        Returns:
+            float: background relative to the maximum of tile
+        """
+        tile_max = float(np.max(tile))
+        if tile_max <= 0:
+            return bg
+        return max(bg * float(np.max(data)) / tile_max, 1e-9)
+
+    def reduce_views(self, data, psf, mode, nout, ranking):
+        """Keep or bin the views of multi-view data (views along the first axis)
+
+        Args:
+            data (numpy.ndarray): measurements (N,Z,Y,X)
+            psf (numpy.ndarray): point-spread function (N,Z,Y,X)
+            mode (str): "Top-K views" or "Binned views"
+            nout (int): number of (virtual) views
+            ranking (str): "PSF energy" or "SNR"
+
+        Returns:
+            tuple: reduced measurements, reduced PSF and quality/speed report
+        """
+        scores = _views.view_scores(psf, data, ranking)
+        groups = _views.group_views(psf, scores, nout, mode)
+        report = _views.views_report(psf, groups, data)
+        show_info(
+            f'{mode}: {report["nviews_in"]} -> {report["nviews_out"]} views, '
+            f'estimated ~{report["speedup_estimate"]:.1f}x faster per iteration, '
+            f'{100 * report["signal_kept"]:.1f}% of the signal kept, '
+            f'max. PSF spread within a bin {report["bin_spread_px"]:.2f} px')
+        return _views.reduce_views(data, groups), _views.reduce_views(
+            psf, groups), report
+
+    def roi_translate(self, roi):
+        """World coordinates (Z,Y,X) of the top-left corner of a ROI of the measurements
+
+        Args:
+            roi (4-tuple of int): region of interest as returned by :func:`clip_roi`
+
+        Returns:
+            numpy.ndarray: translation of the deconvolved volume
+        """
+        layer = self._image_layer_meas.value
+        translate = np.array(layer.translate[-3:], dtype=float)
+        translate[-2:] += np.array(roi[:2]) * np.array(layer.scale[-2:])
+        return translate
+
+    @staticmethod
+    def clip_roi(roi, shape):
+        """Resolve the automatic values of a region of interest and clip it to the field of view
+
+        Args:
+            roi (4-tuple of int): region of interest (x0,y0,w,h), see :func:`select_roi`
+            shape (tuple of int): shape of the data (the two last dimensions are lateral)
+
+        Returns:
+            4-tuple of int: region of interest
+        """
+        roi = np.array(roi)
+        if np.any(roi[2:] == None) or np.any([cr <= 0 for cr in roi[2:]]):
+            roi = np.array((0, 0, *shape[-2:]))
+        elif np.any(roi[:2] == None) or np.any([cr < 0 for cr in roi[:2]]):
+            # top-left coordinates taken in such way that ROI is centered
+            roi[0] = np.maximum(shape[-2] // 2 - roi[2] // 2, 0)
+            roi[1] = np.maximum(shape[-1] // 2 - roi[3] // 2, 0)
+        #make sure that ROI doesn't go out of bounds
+        roi[-2:] = np.minimum(roi[:2] + roi[-2:] - 1,
+                              np.array(shape[-2:]) - 1) - roi[:2] + 1
+        return tuple(map(int, roi))
+
+    @staticmethod
+    def select_roi(data, roi, coi, dim_order):
         """Select region of interest
 
+        Basic indexing is used whenever possible, such that a view of data is returned if a single channel or
+        a regular range of channels is selected (works also for memory-mapped and lazy arrays).
+        During a run, the selection is converted by img_as_float32 (a float32 copy for integer or float64 data,
+        e.g., uint16 images, none for float32 data) and pyxudeconv copies it again when it casts its inputs to float32.
+
         Args:
             data (numpy.ndarray): region of interest is selected from data (3,4,5D array)
             roi (4-tuple of int): region of interest (x0,y0,w,h) with (x0,y0) top-left coordinate and (w,h) the width and height of the ROI, respectively.
                                   If x0,y0==-1, set in such a way that the ROI is centered. If w,h=-1, set to maximize the field of view.
             coi (int or tuple of int): channel of interest (-1 if no channel)
+            dim_order (str): dimensions order of data, one of DIM_ORDERS
+
+        Returns:
+            array: (C,N,Z,Y,X) selection without the singleton channel and view dimensions
         """
 
         #reorder the dimensions to "CNZYX" (singleton dimensions are created)
-        dim_to_expand = None
-        if dim_order == "NZCYX":
-            dim_perm = (2, 0, 1, 3, 4)
-        elif dim_order == "NCZYX":
-            dim_perm = (1, 0, 2, 3, 4)
-        elif dim_order == "ZYX":
-            dim_perm = (0, 1, 2)
-            dim_to_expand = (0, 1)
-        elif dim_order == "CZYX":
-            dim_perm = (0, 1, 2, 3)
-            dim_to_expand = (1)
-        elif dim_order == "NZYX":
-            dim_perm = (0, 1, 2, 3)
-            dim_to_expand = (0)
-
-        data = np.permute_dims(data, dim_perm)
-        if dim_to_expand != None:
-            data = np.expand_dims(data, dim_to_expand)
-
-        coi = np.array(coi)
-        hoi = np.array(np.arange(0, np.shape(data)[1]))
-        roi = np.array(roi)
+        dim_perm, dim_to_expand = DIM_ORDERS[dim_order]
+        data = data.transpose(dim_perm)
+        if dim_to_expand is not None:
+            data = data[dim_to_expand]
 
-        if np.any(roi[2:] == None) or np.any([cr <= 0 for cr in roi[2:]]):
-            roi = np.array((0, 0, *data.shape[-2:]))
-        elif np.any(roi[:2] == None) or np.any([cr < 0 for cr in roi[:2]]):
-            # top-left coordinates taken in such way that ROI is centered
-            roi[0] = np.maximum(data.shape[-2] // 2 - roi[2] // 2, 0)
-            roi[1] = np.maximum(data.shape[-1] // 2 - roi[3] // 2, 0)
-        #make sure that ROI doesn't go out of bounds
-        roi[-2:] = np.minimum(roi[:2] + roi[-2:] - 1,
-                              np.array(data.shape[-2:]) - 1) - roi[:2] + 1
-        roi = tuple(map(int, roi))
+        coi = channel_index(coi)
+        roi = Deconvolution.clip_roi(roi, data.shape)
         out = data[
-            coi.reshape((-1, 1, 1, 1, 1)),
-            hoi.reshape((1, -1, 1, 1, 1)),
+            coi,
+            :,
             :,
             roi[0]:roi[0] + roi[2],
             roi[1]:roi[1] + roi[3],
-        ].squeeze()
-
+        ]
+        #remove the view dimension if singleton
+        if isinstance(coi, int) and out.shape[0] == 1:
+            out = out[0]
+        elif not isinstance(coi, int) and out.shape[1] == 1:
+            out = out[:, 0]
         return out
 
-    def save_results(self, vol, fname, pxsz, unit):
+    def save_results(self,
+                     vol,
+                     fname,
+                     pxsz,
+                     unit,
+                     translate=None,
+                     metadata=None):
         """Add results to the Napari Viewer
 
         Args:
@@ -566,13 +1352,22 @@ class Deconvolution(Container):
             fname (str): File name
             pxsz (tuple of float): pixel size (tuple of 3)
             unit (str): unit of pixel size
+            translate (tuple of float, optional): world position (Z,Y,X) of the volume. Defaults to None.
+            metadata (dict, optional): stored in the layer metadata. Defaults to None.
         """
-        self._viewer.add_image(
-            np.asarray(vol),
+        vol = np.asarray(vol)
+        pxsz = (*tuple([1] * (vol.ndim - len(pxsz))), *pxsz)
+        if translate is not None:
+            translate = (*tuple([0] * (vol.ndim - 3)), *translate)
+        layer = self._viewer.add_image(
+            vol,
             name=fname,
             scale=pxsz,  #(1, pxsz[1] / pxsz[0], pxsz[2] / pxsz[0]),
             units=unit,
+            translate=translate,
+            metadata=dict(metadata) if metadata is not None else None,
         )
+        self._run_layers.append(layer)
 
     def create_fname(
         self,
@@ -637,6 +1432,14 @@ class Deconvolution(Container):
                         'roih'] = self.values_from_param_file['roi'][3]
                 self.static_container.clear()
                 self._set_widgets()
+                if 'model' in self.values_from_param_file:
+                    #the model of the parameter file overrides the chosen ones
+                    for values in self.saved_values_dynamic.values():
+                        values.pop('model', None)
+                    for cwidget in self.dynamic_container:
+                        if cwidget.name == 'model':
+                            cwidget.value = self.values_from_param_file[
+                                'model']
             else:
                 show_info('Invalid parameter file. Expecting a JSON file', )
         else:
@@ -648,6 +1451,36 @@ class Deconvolution(Container):
         """
 
         self.update_dynamic_layout(self._method_layer.value)
+        self.preload_model()
+
+    def preload_model(self):
+        """
+        Load the trained model of the selected learned method in the model cache (if pre-loading is enabled).
+        """
+        method = self._method_layer.value
+        if (not self._preload_layer.value
+                or method not in _model_cache.LEARNED_METHODS):
+            return
+        config = {cw.name: cw.value for cw in self.dynamic_container}
+        device = f'cuda:{self._gpu_layer.value}' if self._gpu_layer.value >= 0 else 'cpu'
+        model = config.get('model', '')
+        if isinstance(model, pathlib.PurePath) and str(
+                model).lower() != 'default model' and not model.exists():
+            show_info(f'Folder {model} does not exist')
+            return
+        try:
+            _model_cache.preload(
+                str(model),
+                config.get('epochoi'),
+                device,
+                airyscan=self._airyscan_layer.value,
+            )
+        except (OSError, RuntimeError, KeyError) as e:
+            show_info(f'Could not pre-load the trained model: {e}')
+            return
+        show_info(
+            f'Trained model pre-loaded ({len(_model_cache.MODEL_CACHE)} model(s) in cache)'
+        )
 
     def update_dynamic_layout(self, method: str):
         """
@@ -661,6 +1494,16 @@ class Deconvolution(Container):
 
         # Clear the dynamic container's current widgets
         self.dynamic_container.clear()
+        self.dynamic_container.extend(self.create_dynamic_widgets(method))
+        self.dynamic_container.extend([self._run_layer])
+        self.extend(self.dynamic_container)
+        self._old_method = method
+
+    def create_dynamic_widgets(self, method: str):
+        """
+        Creates the widgets of the parameters of a method (initialized with the saved values)
+        """
+        dynamic_widgets = []
         text_widget = widgets.Label(value=f"Parameter(s) for {method}")
 
         # Populate the container with different widgets based on the choice
@@ -672,7 +1515,7 @@ class Deconvolution(Container):
                 tooltip=
                 "Results may differ a bit from the non-accelerated version. The expected acceleration is roughly 2-3 times faster.",
             )
-            self.dynamic_container.extend([accel_widget])
+            dynamic_widgets.extend([accel_widget])
         if method == "RLTV":
             reg_widget = widgets.FloatSpinBox(
                 name="tau",
@@ -689,7 +1532,7 @@ class Deconvolution(Container):
                 tooltip=
                 "Results may differ a bit from the non-accelerated version. The expected acceleration is roughly 2-3 times faster.",
             )
-            self.dynamic_container.extend([reg_widget, accel_widget])
+            dynamic_widgets.extend([reg_widget, accel_widget])
         if method == "GARL" or method == "GLS" or method == "GKL":
             #TODO: Add a possibility to do ranged values?
             #TODO: save the parameters in JSON file somewhere so that pyxudeconv can load it.
@@ -705,8 +1548,9 @@ class Deconvolution(Container):
                 name='model',
                 label="Trained model filepath",
                 annotation="str",
-                value=self.values_from_param_file.get('model',
-                                                      'default model'),
+                value=self.saved_values_dynamic[method].get(
+                    "model",
+                    self.values_from_param_file.get('model', 'default model')),
                 widget_type="FileEdit",
                 options=opts_file_edit,
             )
@@ -743,7 +1587,7 @@ class Deconvolution(Container):
                 tooltip=
                 "Results may differ a bit from the non-accelerated version. The expected acceleration is roughly 2-3 times faster.",
             )
-            self.dynamic_container.extend([
+            dynamic_widgets.extend([
                 text_widget,
                 model_widget,
                 epochoi_widget,
@@ -759,8 +1603,6 @@ class Deconvolution(Container):
                 label="Regularization parameter",
                 step=0.0001,
             )
-            self.dynamic_container.extend([text_widget, reg_widget])
+            dynamic_widgets.extend([text_widget, reg_widget])
 
-        self.dynamic_container.extend([self._run_layer])
-        self.extend(self.dynamic_container)
-        self._old_method = method
+        return dynamic_widgets